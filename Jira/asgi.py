@@ -0,0 +1,23 @@
+"""
+ASGI config for Jira project.
+
+It exposes the ASGI callable as a module-level variable named ``application``. Project event
+streams (``/main/projects/<id>/events/``) are served by main.events; every other request goes
+through Django.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Jira.settings')
+
+django_application = get_asgi_application()
+
+# Imported once Django is set up, since it loads models.
+from main.events import EventStreamApplication  # noqa: E402
+
+application = EventStreamApplication(django_application)
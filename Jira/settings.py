@@ -47,10 +47,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.middleware.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'utils.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,11 +81,79 @@ WSGI_APPLICATION = 'Jira.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# JIRA_DB_PROFILE selects the database: 'sqlite' (local/test) or 'postgres' (production).
+DB_PROFILE = os.environ.get('JIRA_DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('JIRA_DB_NAME', 'jira'),
+            'USER': os.environ.get('JIRA_DB_USER', 'jira'),
+            'PASSWORD': os.environ.get('JIRA_DB_PASSWORD', ''),
+            'HOST': os.environ.get('JIRA_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('JIRA_DB_PORT', '5432'),
+            # Persistent connections, reused across requests until they are this many seconds old.
+            'CONN_MAX_AGE': int(os.environ.get('JIRA_DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    # Behind pgbouncer in transaction pooling mode, server-side cursors (QuerySet.iterator) must be off.
+    if os.environ.get('JIRA_DB_POOLER') == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
     }
+
+# Comma separated replica hosts (postgres) or database files (sqlite), e.g. JIRA_DB_REPLICAS=replica1,replica2.
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, os.environ.get('JIRA_DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'},
+                            **({'HOST': replica} if DB_PROFILE == 'postgres' else {'NAME': replica}))
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['utils.db.ReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write (read-your-writes), and the cache alias that
+# holds the pins. LocMemCache is per process: with REPLICA_DATABASES set, point this at a cache every process
+# shares (memcached, redis), which the utils.E001 system check enforces.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE = 'default'
+
+# Applied by utils.db.configure_connection to every new SQLite connection.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+}
+
+# Persistent connections idle for longer than this are pinged before a request uses them.
+DATABASE_HEALTH_CHECK_AFTER = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
 }
 
 
@@ -129,10 +199,11 @@ AUTH_USER_MODEL = 'authe.MainUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'authe.authentication.CachedJSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.DefaultCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
 JWT_AUTH = {
@@ -143,13 +214,13 @@ JWT_AUTH = {
     'rest_framework_jwt.utils.jwt_decode_handler',
 
     'JWT_PAYLOAD_HANDLER':
-    'rest_framework_jwt.utils.jwt_payload_handler',
+    'authe.authentication.jwt_payload_handler',
 
     'JWT_PAYLOAD_GET_USER_ID_HANDLER':
     'rest_framework_jwt.utils.jwt_get_user_id_from_payload_handler',
 
     'JWT_RESPONSE_PAYLOAD_HANDLER':
-    'rest_framework_jwt.utils.jwt_response_payload_handler',
+    'authe.authentication.jwt_response_payload_handler',
 
     'JWT_SECRET_KEY': SECRET_KEY,
     'JWT_GET_USER_SECRET_KEY': None,
@@ -170,46 +241,102 @@ JWT_AUTH = {
     'JWT_AUTH_COOKIE': None,
 }
 
+# Seconds an authenticated user stays in the in-process cache of authe.authentication.
+AUTH_USER_CACHE_TTL = 60
+
+# Log levels are gated before any formatting; JIRA_LOG_LEVEL=DEBUG brings the debug output back.
+LOG_LEVEL = os.environ.get('JIRA_LOG_LEVEL', 'INFO')
+
+# Loggers only talk to the queue_* handlers; their QueueListener threads do the file and console I/O.
+# dictConfig creates handlers in name order, so the queue_* names must sort after the handlers they feed.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'verbose': {
-            'format': '%(levelname)s %(asctime)s %(message)s',
+        'json': {
+            '()': 'utils.log.JSONFormatter',
         },
         'simple': {
             'format': '%(levelname)s - %(message)s',
-        }
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
-        'main_handler': {
-            'level': 'DEBUG',
+        'main_file': {
             'class': 'logging.handlers.RotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs') + '/main.log',
-            'formatter': 'verbose'
+            'formatter': 'json'
         },
-        'authe_handler': {
-            'level': 'DEBUG',
+        'authe_file': {
             'class': 'logging.handlers.RotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs') + '/authe.log',
-            'formatter': 'verbose'
+            'formatter': 'json'
+        },
+        'metrics_file': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs') + '/metrics.log',
+            'formatter': 'json'
+        },
+        'queue_main': {
+            '()': 'utils.log.BackgroundQueueHandler',
+            'handlers': ['cfg://handlers.main_file', 'cfg://handlers.console'],
+        },
+        'queue_authe': {
+            '()': 'utils.log.BackgroundQueueHandler',
+            'handlers': ['cfg://handlers.authe_file', 'cfg://handlers.console'],
+        },
+        'queue_metrics': {
+            '()': 'utils.log.BackgroundQueueHandler',
+            'handlers': ['cfg://handlers.metrics_file'],
         },
     },
     'loggers': {
         'main': {
-            'handlers': ['main_handler', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['queue_main'],
+            'level': LOG_LEVEL,
+        },
+        'utils': {
+            'handlers': ['queue_main'],
+            'level': LOG_LEVEL,
         },
         'authe': {
-            'handlers': ['authe_handler', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['queue_authe'],
+            'level': LOG_LEVEL,
+        },
+        'metrics': {
+            'handlers': ['queue_metrics'],
+            'level': 'INFO',
+            'propagate': False,
         }
     },
 }
 
+# utils.middleware.PerformanceMiddleware: Server-Timing header, N+1 threshold and samples kept per view.
+PERFORMANCE_SERVER_TIMING = DEBUG
+PERFORMANCE_DUPLICATE_QUERY_THRESHOLD = 3
+PERFORMANCE_SAMPLE_SIZE = 1000
+
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'utils.storage.ContentAddressedStorage'
+# 'X-Accel-Redirect' (nginx, served from DOCUMENT_SENDFILE_URL as an internal location) or 'X-Sendfile' (Apache)
+DOCUMENT_SENDFILE_HEADER = None
+DOCUMENT_SENDFILE_URL = '/protected/'
+BACKGROUND_TASKS_EAGER = False
+
+UPLOAD_CHUNK_ROOT = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Pending uploads with no chunk for this long are failed and their part files removed by purge_uploads.
+UPLOAD_EXPIRY_HOURS = 24
+
+# main.changelog: largest feed page and how long tombstones survive compaction.
+CHANGE_LOG_PAGE_SIZE = 500
+CHANGE_LOG_TOMBSTONE_DAYS = 30
+
+# main.events: pub/sub backend behind the project event streams, per-subscriber queue and keepalive interval.
+PUBSUB_BACKEND = 'utils.pubsub.LocalBackend'
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE_SECONDS = 15
@@ -0,0 +1,116 @@
+import copy
+import threading
+import time
+from calendar import timegm
+from datetime import datetime
+
+import jwt
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.utils import jwt_payload_handler as default_payload_handler
+
+from authe.models import MainUser, RefreshToken
+
+
+def jwt_payload_handler(user):
+    payload = default_payload_handler(user)
+    payload['iat'] = timegm(datetime.utcnow().utctimetuple())
+    return payload
+
+
+def jwt_response_payload_handler(token, user=None, request=None):
+    # Login also hands out a refresh token, so clients renew through /authe/refresh/ without a password.
+    return {
+        'token': token,
+        'refresh_token': RefreshToken.objects.issue(user),
+    }
+
+
+def access_token(user):
+    return api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user))
+
+
+class UserCache:
+    """Short-TTL in-process cache of authenticated users keyed by (user id, token iat).
+
+    Entries are dropped on MainUser save/delete in this process; other processes see changes once
+    their entries expire.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return copy.copy(entry[1])
+
+    def set(self, key, user):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, copy.copy(user))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k[0] != user_id}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def decode_token(token):
+    if api_settings.JWT_GET_USER_SECRET_KEY or api_settings.JWT_PUBLIC_KEY:
+        return api_settings.JWT_DECODE_HANDLER(token)
+    # One verifying decode instead of the handler's unverified pass followed by a verified one.
+    return jwt.decode(token, api_settings.JWT_SECRET_KEY, api_settings.JWT_VERIFY,
+                      options={'verify_exp': api_settings.JWT_VERIFY_EXPIRATION},
+                      leeway=api_settings.JWT_LEEWAY, audience=api_settings.JWT_AUDIENCE,
+                      issuer=api_settings.JWT_ISSUER, algorithms=[api_settings.JWT_ALGORITHM])
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """JSONWebTokenAuthentication that resolves the token's user without a query on repeat requests."""
+
+    def authenticate(self, request):
+        jwt_value = self.get_jwt_value(request)
+        if jwt_value is None:
+            return None
+        try:
+            payload = decode_token(jwt_value)
+        except jwt.ExpiredSignature:
+            raise exceptions.AuthenticationFailed('Signature has expired.')
+        except jwt.DecodeError:
+            raise exceptions.AuthenticationFailed('Error decoding signature.')
+        except jwt.InvalidTokenError:
+            raise exceptions.AuthenticationFailed()
+        return self.authenticate_credentials(payload), jwt_value
+
+    def authenticate_credentials(self, payload):
+        user_id, username = payload.get('user_id'), payload.get('username')
+        if user_id is None or not username:
+            raise exceptions.AuthenticationFailed('Invalid payload.')
+        key = (user_id, payload.get('iat', payload.get('exp')))
+        user = user_cache.get(key)
+        if user is None:
+            user = MainUser.objects.filter(pk=user_id).first()
+            if user is None:
+                raise exceptions.AuthenticationFailed('Invalid signature.')
+            user_cache.set(key, user)
+        if user.get_username() != username:
+            raise exceptions.AuthenticationFailed('Invalid signature.')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User account is disabled.')
+        return user
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from authe.authentication import CachedJSONWebTokenAuthentication, user_cache
+from authe.models import MainUser
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request authentication time and queries for the stock and cached JWT classes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = MainUser.objects.create_user(username=f'benchmark-{time.time()}', password='benchmark')
+                token = api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user))
+                request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'JWT {token}')
+                for authentication in (JSONWebTokenAuthentication(), CachedJSONWebTokenAuthentication()):
+                    user_cache.clear()
+                    self.report(authentication, request, options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, authentication, request, requests):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(requests):
+                authentication.authenticate(Request(request))
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f'{type(authentication).__name__}: {elapsed / requests * 1e6:.1f}us per request, '
+                          f'{len(queries) / requests:.3f} queries per request')
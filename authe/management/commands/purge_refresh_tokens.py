@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from authe.models import RefreshToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired refresh tokens.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{RefreshToken.objects.purge()} expired refresh tokens deleted')
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 05:16
+
+from django.db import migrations
+import utils.storage
+import utils.upload
+import utils.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authe', '0003_refreshtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=utils.storage.ContentAddressedFileField(blank=True, null=True, upload_to=utils.upload.avatar_path, validators=[utils.validators.validate_file_size, utils.validators.validate_extension]),
+        ),
+    ]
@@ -1,5 +1,12 @@
+import hashlib
+import secrets
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from utils.storage import ContentAddressedFileField
 from utils.upload import avatar_path
 from utils.validators import validate_file_size, validate_extension
 
@@ -12,11 +19,89 @@ class MainUser(AbstractUser):
     def __str__(self):
         return f'{self.id}: {self.username}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_username = instance.__dict__.get('username')
+        return instance
+
 
 class Profile(models.Model):
     bio = models.CharField(max_length=200, null=True, blank=True)
     address = models.CharField(max_length=100, null=True, blank=True)
     job = models.CharField(max_length=100, null=True, blank=True)
-    avatar = models.FileField(upload_to=avatar_path, validators=[validate_file_size, validate_extension], null=True,
-                              blank=True)
-    user = models.OneToOneField(MainUser, on_delete=models.CASCADE)
\ No newline at end of file
+    avatar = ContentAddressedFileField(upload_to=avatar_path, validators=[validate_file_size, validate_extension],
+                                       null=True, blank=True)
+    user = models.OneToOneField(MainUser, on_delete=models.CASCADE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_avatar = instance.__dict__.get('avatar')
+        return instance
+
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+class RefreshTokenManager(models.Manager):
+    def issue(self, user, family=None):
+        """Creates a refresh token and returns its raw value; only the sha256 is stored."""
+        token = secrets.token_urlsafe(32)
+        self.create(token_hash=_hash_token(token), user=user, family=family or uuid.uuid4(),
+                    expires_at=timezone.now() + settings.JWT_AUTH['JWT_REFRESH_EXPIRATION_DELTA'])
+        return token
+
+    def rotate(self, token):
+        """Spends ``token`` and returns (user, new refresh token) from the same family.
+
+        Presenting a token that was already spent revokes its whole family, since either the client
+        or an attacker holds a stolen copy.
+        """
+        now = timezone.now()
+        refresh = self.select_related('user').filter(token_hash=_hash_token(token)).first()
+        if refresh is None:
+            raise RefreshTokenError('Invalid refresh token.')
+        spent = self.filter(id=refresh.id, revoked_at__isnull=True, expires_at__gt=now).update(revoked_at=now)
+        if not spent:
+            if refresh.revoked_at is not None:
+                self.revoke_family(refresh.family)
+            raise RefreshTokenError('Refresh token is expired or revoked.')
+        if not refresh.user.is_active:
+            raise RefreshTokenError('User account is disabled.')
+        return refresh.user, self.issue(refresh.user, refresh.family)
+
+    def revoke(self, token):
+        family = self.filter(token_hash=_hash_token(token)).values_list('family', flat=True).first()
+        if family is not None:
+            self.revoke_family(family)
+
+    def revoke_family(self, family):
+        self.filter(family=family, revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+    def purge(self):
+        return self.filter(expires_at__lt=timezone.now()).delete()[0]
+
+
+class RefreshToken(models.Model):
+    token_hash = models.CharField(max_length=64, unique=True)
+    family = models.UUIDField(db_index=True)
+    user = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='refresh_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    objects = RefreshTokenManager()
+
+    class Meta:
+        verbose_name = 'Refresh token'
+        verbose_name_plural = 'Refresh tokens'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.family}'
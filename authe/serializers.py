@@ -11,4 +11,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = MainUser.objects.create_user(**validated_data)
-        return user
\ No newline at end of file
+        return user
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField()
@@ -1,10 +1,31 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from authe.authentication import user_cache
 from authe.models import MainUser, Profile
+from utils.upload import release_files
+
+
+@receiver(post_save, sender=MainUser)
+@receiver(post_delete, sender=MainUser)
+def user_changed(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
 
 
 @receiver(post_save, sender=MainUser)
 def user_created(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Profile)
+def avatar_changed(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_avatar', None)
+    if loaded and loaded != instance.avatar.name:
+        instance.avatar.storage.delete(loaded)
+    instance._loaded_avatar = instance.avatar.name
+
+
+@receiver(post_delete, sender=Profile)
+def avatar_deleted(sender, instance, **kwargs):
+    release_files(instance.avatar)
@@ -1,3 +1,69 @@
-from django.test import TestCase
+import hashlib
 
-# Create your tests here.
+from rest_framework.test import APITestCase
+
+from authe.authentication import user_cache
+from authe.models import MainUser, RefreshToken
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = MainUser.objects.create_user(username='owner', password='password')
+        response = self.client.post('/authe/login/', {'username': 'owner', 'password': 'password'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {response.data['token']}")
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(2):
+            self.client.get(f'/authe/authe/{self.user.id}/')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/authe/authe/{self.user.id}/')
+        self.assertEqual(response.data['username'], 'owner')
+
+    def test_user_save_invalidates_cache(self):
+        self.client.get(f'/authe/authe/{self.user.id}/')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.client.get(f'/authe/authe/{self.user.id}/').status_code, 401)
+
+        self.user.username = 'owner'
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(f'/authe/authe/{self.user.id}/').status_code, 401)
+
+    def test_rejects_bad_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION='JWT not.a.token')
+        self.assertEqual(self.client.get('/authe/authe/').status_code, 401)
+
+
+class RefreshTokenTests(APITestCase):
+    def setUp(self):
+        self.user = MainUser.objects.create_user(username='owner', password='password')
+        self.refresh_token = self.client.post('/authe/login/', {'username': 'owner', 'password': 'password'}) \
+            .data['refresh_token']
+
+    def refresh(self, token, **headers):
+        return self.client.post('/authe/refresh/', {'refresh_token': token}, **headers)
+
+    def test_refresh_rotates_tokens(self):
+        response = self.refresh(self.refresh_token, HTTP_AUTHORIZATION='JWT expired.access.token')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh_token'], self.refresh_token)
+        spent = RefreshToken.objects.get(token_hash=hashlib.sha256(self.refresh_token.encode()).hexdigest())
+        self.assertIsNotNone(spent.revoked_at)
+        self.assertFalse(RefreshToken.objects.filter(token_hash=self.refresh_token).exists())
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {response.data['token']}")
+        self.assertEqual(self.client.get(f'/authe/authe/{self.user.id}/').status_code, 200)
+        self.assertEqual(self.refresh(response.data['refresh_token']).status_code, 200)
+
+    def test_reuse_revokes_the_family(self):
+        rotated = self.refresh(self.refresh_token).data['refresh_token']
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        self.assertEqual(self.refresh(rotated).status_code, 401)
+        self.assertFalse(RefreshToken.objects.filter(revoked_at__isnull=True).exists())
+
+    def test_logout_revokes(self):
+        self.assertEqual(self.client.post('/authe/logout/', {'refresh_token': self.refresh_token}).status_code, 204)
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        self.assertEqual(self.refresh('unknown').status_code, 401)
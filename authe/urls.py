@@ -3,16 +3,18 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_jwt.views import obtain_jwt_token
 
 
-from authe.views import RegisterUserAPIView, UserViewSet
+from authe.views import RegisterUserAPIView, UserViewSet, RefreshTokenAPIView, LogoutAPIView
 
 urlpatterns = [
     path('login/', obtain_jwt_token),
-    path('register/', RegisterUserAPIView.as_view())
+    path('register/', RegisterUserAPIView.as_view()),
+    path('refresh/', RefreshTokenAPIView.as_view()),
+    path('logout/', LogoutAPIView.as_view())
 ]
 
 
 router = DefaultRouter()
-router.register('authe', UserViewSet, base_name='authe')
+router.register('authe', UserViewSet, basename='authe')
 
 
 urlpatterns += router.urls
\ No newline at end of file
@@ -3,8 +3,9 @@ from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from authe.serializers import UserSerializer
-from authe.models import MainUser, Profile
+from authe.authentication import access_token
+from authe.serializers import UserSerializer, RefreshTokenSerializer
+from authe.models import MainUser, Profile, RefreshToken, RefreshTokenError
 
 import logging
 
@@ -18,12 +19,40 @@ class RegisterUserAPIView(APIView):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"User {serializer.data.get('username')} is created")
+            logger.info("User %s is created", serializer.data.get('username'))
             return Response(serializer.data)
-        logger.error(f"User creation failed: {serializer.errors}")
+        logger.error("User creation failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RefreshTokenAPIView(APIView):
+    """Trades a refresh token for a new access token and a rotated refresh token, no password hashing."""
+    http_method_names = ['post']
+    # Clients usually refresh with an expired access token still attached.
+    authentication_classes = ()
+
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            user, refresh_token = RefreshToken.objects.rotate(serializer.validated_data['refresh_token'])
+        except RefreshTokenError as error:
+            logger.warning("Token refresh failed: %s", error)
+            return Response({'detail': str(error)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({'token': access_token(user), 'refresh_token': refresh_token})
+
+
+class LogoutAPIView(APIView):
+    http_method_names = ['post']
+    authentication_classes = ()
+
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        RefreshToken.objects.revoke(serializer.validated_data['refresh_token'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
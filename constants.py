@@ -27,4 +27,28 @@ BLOCK_TYPES = (
     (BLOCK_TODO, 'TODO'),
     (BLOCK_IN_PROCESS, 'IN_PROCESS'),
     (BLOCK_DONE, 'DONE')
-)
\ No newline at end of file
+)
+
+TASK_ORDER_GAP = 1024
+
+UPLOAD_PENDING = 1
+UPLOAD_PROCESSING = 2
+UPLOAD_DONE = 3
+UPLOAD_FAILED = 4
+
+UPLOAD_STATUSES = (
+    (UPLOAD_PENDING, 'PENDING'),
+    (UPLOAD_PROCESSING, 'PROCESSING'),
+    (UPLOAD_DONE, 'DONE'),
+    (UPLOAD_FAILED, 'FAILED')
+)
+
+CHANGE_CREATED = 1
+CHANGE_UPDATED = 2
+CHANGE_DELETED = 3
+
+CHANGE_ACTIONS = (
+    (CHANGE_CREATED, 'CREATED'),
+    (CHANGE_UPDATED, 'UPDATED'),
+    (CHANGE_DELETED, 'DELETED')
+)
@@ -1,4 +1,7 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.core.signals import request_started, request_finished
+from django.db.backends.signals import connection_created
 
 
 class MainConfig(AppConfig):
@@ -6,3 +9,8 @@ class MainConfig(AppConfig):
 
     def ready(self):
         import main.signals
+        from utils import db
+        connection_created.connect(db.configure_connection, dispatch_uid='configure_connection')
+        request_started.connect(db.check_connection_health, dispatch_uid='check_connection_health')
+        request_finished.connect(db.mark_connection_used, dispatch_uid='mark_connection_used')
+        checks.register(db.check_replica_pin_cache, checks.Tags.caches)
@@ -0,0 +1,32 @@
+from django.db.models import F
+
+from main.models import Block, Task
+
+BLOCK_FIELDS = ('id', 'name', 'block_type', 'tasks_count')
+TASK_FIELDS = ('id', 'block_id', 'name', 'description', 'priority', 'order', 'creator_id', 'executor_id',
+               'comments_count', 'documents_count')
+
+
+def snapshot(project):
+    """The project with its blocks and their ordered tasks, from two queries after the project itself."""
+    blocks = list(Block.objects.filter(project=project).order_by('block_type', 'id').values(*BLOCK_FIELDS))
+    by_block = {}
+    for block in blocks:
+        block['tasks'] = by_block[block['id']] = []
+    tasks = Task.objects.filter(block__project=project).order_by('block_id', 'order', 'id') \
+        .values(*TASK_FIELDS, creator_name=F('creator__username'), executor_name=F('executor__username'))
+    for task in tasks:
+        by_block[task.pop('block_id')].append(task)
+    return {
+        'id': project.id,
+        'name': project.name,
+        'description': project.description,
+        'status': project.status,
+        'project_type': project.project_type,
+        'creator_name': project.creator.username if project.creator_id else '',
+        'blocks_count': project.blocks_count,
+        'tasks_count': project.tasks_count,
+        'done_count': project.done_count,
+        'blocks': blocks,
+    }
+
@@ -0,0 +1,68 @@
+import threading
+import uuid
+
+from django.core.cache import caches
+
+from utils.db import primary_reads
+
+RESPONSE_CACHE = 'responses'
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _version_key(resource, pk):
+    return f'version:{resource}:{pk}'
+
+
+def get_version(resource, pk):
+    cache = caches[RESPONSE_CACHE]
+    key = _version_key(resource, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(resource, *pks):
+    # A fresh random token rather than a counter: if LRU culling drops the version key,
+    # entries written under an older version can never become reachable again.
+    cache = caches[RESPONSE_CACHE]
+    for pk in {pk for pk in pks if pk is not None}:
+        cache.set(_version_key(resource, pk), uuid.uuid4().hex, None)
+        _count('invalidations')
+
+
+def cached_data(resource, pk, request, build, etag=None):
+    """Returns ``build()`` cached under the resource version and the full request path.
+
+    An ``etag`` computed from the rows themselves replaces the version: the entry then always matches
+    the validators sent with it, even when another process missed the invalidation.
+    """
+    cache = caches[RESPONSE_CACHE]
+    version = etag if etag is not None else get_version(resource, pk)
+    key = f'response:{resource}:{pk}:{version}:{request.get_full_path()}'
+    data = cache.get(key)
+    if data is not None:
+        _count('hits')
+        return data
+    _count('misses')
+    # A lagging replica would put rows from before the write that invalidated the entry back in the cache.
+    with primary_reads():
+        data = build()
+    cache.set(key, data)
+    return data
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,165 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connections, router
+from django.db.models import Subquery
+
+from constants import CHANGE_ACTIONS, CHANGE_CREATED, CHANGE_DELETED
+from main.models import Project, Block, Task, TaskComment, TaskDocument, ChangeLogEntry
+
+OBJECT_TYPES = {Project: 'project', Block: 'block', Task: 'task', TaskComment: 'comment', TaskDocument: 'document'}
+MODELS = {object_type: model for model, object_type in OBJECT_TYPES.items()}
+ACTIONS = {action: name.lower() for action, name in CHANGE_ACTIONS}
+
+# What the feed sends for created and updated objects. The denormalized counters are left out: main.counters
+# changes them with F() updates that write no entries, so clients count the children they sync instead.
+FIELDS = {
+    'project': ('id', 'name', 'description', 'status', 'project_type', 'creator_id', 'updated_at', 'version'),
+    'block': ('id', 'project_id', 'name', 'block_type', 'updated_at', 'version'),
+    'task': ('id', 'block_id', 'name', 'description', 'priority', 'order', 'creator_id', 'executor_id',
+             'updated_at', 'version'),
+    'comment': ('id', 'task_id', 'body', 'creator_id', 'created_at', 'updated_at', 'version'),
+    'document': ('id', 'task_id', 'filename', 'checksum', 'creator_id', 'updated_at', 'version'),
+}
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """Skips entries for rows a cascade deletes along with a parent that gets its own tombstone."""
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+
+
+def active():
+    return not getattr(_state, 'depth', 0)
+
+
+def known_project_id(instance):
+    """The project id when it is on the instance or its loaded parents, else None."""
+    if isinstance(instance, Project):
+        return instance.id
+    if isinstance(instance, Block):
+        return instance.project_id
+    task = instance if isinstance(instance, Task) else \
+        instance.task if type(instance).task.is_cached(instance) else None
+    if task is not None and Task.block.is_cached(task):
+        return task.block.project_id
+    return None
+
+
+# How the project id is reached from the parent of a task, comment or document.
+PROJECT_PATHS = {Block: 'project_id', Task: 'block__project_id'}
+
+
+def parent_key(instance):
+    """(model, id) of the parent of a task, comment or document, read from the instance's own column."""
+    if isinstance(instance, Task):
+        return Block, instance.block_id
+    return Task, instance.task_id
+
+
+def project_id_query(instance):
+    """Lookup of the project of a task, comment or document whose parents are not loaded."""
+    model, pk = parent_key(instance)
+    return model.objects.filter(id=pk).values_list(PROJECT_PATHS[model], flat=True)
+
+
+def project_ids(keys):
+    """Maps parent keys from parent_key() to project ids with one query per parent model."""
+    found = {}
+    for model, path in PROJECT_PATHS.items():
+        ids = {pk for key_model, pk in keys if key_model is model}
+        if ids:
+            found.update(((model, pk), project_id)
+                         for pk, project_id in model.objects.filter(id__in=ids).values_list('id', path))
+    return found
+
+
+def _project_id(instance):
+    """The project id, or a subquery the INSERT resolves when the parents are not loaded."""
+    project_id = known_project_id(instance)
+    if project_id is None:
+        return Subquery(project_id_query(instance)[:1])
+    return project_id
+
+
+def lock_projects(instances):
+    """Locks the projects of the instances until the transaction ends, before their entries get ids.
+
+    Entries of one project then commit in id order, so a client that read up to a cursor never misses a
+    lower id committed later. SQLite holds one write lock per database for the same effect.
+    """
+    if not connections[router.db_for_write(ChangeLogEntry)].features.has_select_for_update:
+        return
+    ids, parents = set(), set()
+    for instance in instances:
+        project_id = known_project_id(instance)
+        if project_id is None:
+            parents.add(parent_key(instance))
+        else:
+            ids.add(project_id)
+    ids.update(project_ids(parents).values())
+    list(Project.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', flat=True))
+
+
+def record(action, *instances):
+    if not instances or not active():
+        return
+    lock_projects(instances)
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(project_id=_project_id(instance), object_type=OBJECT_TYPES[type(instance)],
+                       object_id=instance.id, action=action, version=instance.version)
+        for instance in instances)
+
+
+def record_provisioned(project, blocks):
+    """Logs the blocks a new project is provisioned with.
+
+    bulk_create() does not return ids on every backend, so they are looked up by block type in the INSERT.
+    No other transaction can see the new project yet, so there is nothing to lock.
+    """
+    if not active():
+        return
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(project_id=project.id, object_type=OBJECT_TYPES[Block], action=CHANGE_CREATED, version=1,
+                       object_id=Subquery(Block.objects.filter(project=project, block_type=block.block_type)
+                                          .values('id')[:1]))
+        for block in blocks)
+
+
+def feed(project_id, since=0, limit=100):
+    """Changes after the ``since`` cursor, with the current row of every object that still exists.
+
+    Repeated changes to one object within the page are folded into the last one. Cursors are safe to
+    resume from because record() allocates the ids of a project's entries under lock_projects().
+    """
+    entries = list(ChangeLogEntry.objects.filter(project_id=project_id, id__gt=since).order_by('id')
+                   .values('id', 'object_type', 'object_id', 'action', 'version')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest.pop((entry['object_type'], entry['object_id']), None)
+        latest[entry['object_type'], entry['object_id']] = entry
+    wanted = {}
+    for (object_type, object_id), entry in latest.items():
+        if entry['action'] != CHANGE_DELETED:
+            wanted.setdefault(object_type, []).append(object_id)
+    rows = {}
+    for object_type, ids in wanted.items():
+        for row in MODELS[object_type].objects.filter(id__in=ids).values(*FIELDS[object_type]):
+            rows[object_type, row['id']] = row
+
+    return {
+        'changes': [{'cursor': entry['id'], 'type': entry['object_type'], 'id': entry['object_id'],
+                     'action': ACTIONS[entry['action']], 'version': entry['version'], 'data': rows.get(key)}
+                    for key, entry in latest.items()],
+        'cursor': entries[-1]['id'] if entries else since,
+        'has_more': has_more,
+    }
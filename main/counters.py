@@ -0,0 +1,124 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from constants import BLOCK_DONE
+from main import cache
+from main.models import Project, Block, Task, TaskComment, TaskDocument, touched
+
+_state = threading.local()
+
+
+@contextmanager
+def counters_suspended():
+    """Skips per-row counter updates while a cascade deletes children whose parent goes away too."""
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+
+
+def counters_active():
+    return not getattr(_state, 'depth', 0)
+
+
+def _block_info(block_id, block=None):
+    if block is not None and block.id == block_id:
+        return block.project_id, block.block_type
+    return Block.objects.filter(id=block_id).values_list('project_id', 'block_type').first() or (None, None)
+
+
+# update() sends no post_save, so the helpers below drop the cached list responses showing the counters
+# themselves: block task lists show task counters, project block lists show block counters.
+
+def add_tasks(block_id, delta, block=None):
+    project_id, block_type = _block_info(block_id, block)
+    if project_id is None:
+        return
+    Block.objects.filter(id=block_id).update(**touched(tasks_count=F('tasks_count') + delta))
+    Project.objects.filter(id=project_id).update(**touched(
+        tasks_count=F('tasks_count') + delta,
+        done_count=F('done_count') + (delta if block_type == BLOCK_DONE else 0)))
+    cache.invalidate('project', project_id)
+
+
+def remove_block(project_id, block_type, tasks_count):
+    Project.objects.filter(id=project_id).update(**touched(
+        blocks_count=F('blocks_count') - 1,
+        tasks_count=F('tasks_count') - tasks_count,
+        done_count=F('done_count') - (tasks_count if block_type == BLOCK_DONE else 0)))
+    cache.invalidate('project', project_id)
+
+
+def add_blocks(project_id, delta):
+    Project.objects.filter(id=project_id).update(**touched(blocks_count=F('blocks_count') + delta))
+    cache.invalidate('project', project_id)
+
+
+def add_task_children(task_id, comments=0, documents=0, task=None):
+    Task.objects.filter(id=task_id).update(**touched(comments_count=F('comments_count') + comments,
+                                                     documents_count=F('documents_count') + documents))
+    if task is not None and task.id == task_id:
+        block_id = task.block_id
+    else:
+        block_id = Task.objects.filter(id=task_id).values_list('block_id', flat=True).first()
+    cache.invalidate('block', block_id)
+
+
+def _invalidate(model, ids):
+    """Drops the cached lists showing counters of the given rows."""
+    if model is Task:
+        cache.invalidate('block', *Task.objects.filter(id__in=ids).values_list('block_id', flat=True))
+    elif model is Block:
+        cache.invalidate('project', *Block.objects.filter(id__in=ids).values_list('project_id', flat=True))
+
+
+# (model, counter field, counted model, path from the counted model to the counter's owner, extra filters)
+COUNTERS = (
+    (Block, 'tasks_count', Task, 'block', {}),
+    (Project, 'blocks_count', Block, 'project', {}),
+    (Project, 'tasks_count', Task, 'block__project', {}),
+    (Project, 'done_count', Task, 'block__project', {'block__block_type': BLOCK_DONE}),
+    (Task, 'comments_count', TaskComment, 'task', {}),
+    (Task, 'documents_count', TaskDocument, 'task', {}),
+)
+
+
+def _actual_count(counted_model, path, filters):
+    counts = counted_model.objects.filter(**{path: OuterRef('pk')}, **filters).order_by() \
+        .values(path).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+def reconcile(scope=None, counters=None):
+    """Rewrites counters that drifted from the real counts and returns how many rows were fixed per counter.
+
+    ``scope`` maps models to the ids to check, ``counters`` limits the pass to ``'Model.field'`` labels.
+    """
+    fixed = {}
+    for model, field, counted_model, path, filters in COUNTERS:
+        label = f'{model.__name__}.{field}'
+        if counters is not None and label not in counters:
+            continue
+        queryset = model.objects.all()
+        if scope is not None:
+            if model not in scope:
+                continue
+            queryset = queryset.filter(id__in=scope[model])
+        drifted = list(queryset.annotate(actual=_actual_count(counted_model, path, filters))
+                       .exclude(**{field: F('actual')}).values_list('id', flat=True))
+        if drifted:
+            actual = _actual_count(counted_model, path, filters)
+            model.objects.filter(id__in=drifted).update(**touched(**{field: actual}))
+            _invalidate(model, drifted)
+        fixed[label] = len(drifted)
+    return fixed
+
+
+def reconcile_moves(block_ids):
+    """Fixes the counters a task moving between blocks of one project can change."""
+    project_ids = set(Block.objects.filter(id__in=block_ids).values_list('project_id', flat=True))
+    return reconcile({Block: block_ids, Project: project_ids}, counters={'Block.tasks_count', 'Project.done_count'})
@@ -0,0 +1,127 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from utils.storage import ContentAddressedStorage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """File-like view over ``length`` bytes of ``file`` starting at ``offset``."""
+
+    def __init__(self, file, offset, length):
+        self.file, self.remaining = file, length
+        file.seek(offset)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def document_etag(document, path):
+    """Content-addressed names already are the sha256, legacy files fall back to size and mtime."""
+    if document.checksum:
+        return quote_etag(document.checksum)
+    digest = os.path.splitext(os.path.basename(document.document.name))[0]
+    if document.document.name.startswith(f'{ContentAddressedStorage.prefix}/'):
+        return quote_etag(digest)
+    stat = os.stat(path)
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}')
+
+
+def parse_range(header, size):
+    """Returns (offset, length) for a single satisfiable byte range, None to send the whole file.
+
+    Raises ValueError when the range cannot be satisfied. Multi-range requests get the whole file.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        length = min(int(end), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def content_disposition(filename):
+    """``attachment`` with the filename escaped as a quoted-string, or RFC 5987 encoded when it is not plain ASCII."""
+    if filename.isascii() and filename.isprintable():
+        escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+        return f'attachment; filename="{escaped}"'
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def _sendfile_response(document, path, filename):
+    header = settings.DOCUMENT_SENDFILE_HEADER
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if header == 'X-Accel-Redirect':
+        response[header] = settings.DOCUMENT_SENDFILE_URL + quote(document.document.name)
+    else:
+        response[header] = path
+    response['Content-Disposition'] = content_disposition(filename)
+    return response
+
+
+def _file_response(request, path, filename, etag):
+    size = os.path.getsize(path)
+    byte_range = None
+    if request.META.get('HTTP_RANGE') and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        # A real file object lets the WSGI server use wsgi.file_wrapper (sendfile) for the body.
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+    else:
+        offset, length = byte_range
+        response = FileResponse(RangeFile(open(path, 'rb'), offset, length), as_attachment=True,
+                                filename=filename, status=206)
+        response['Content-Range'] = f'bytes {offset}-{offset + length - 1}/{size}'
+        response['Content-Length'] = length
+    # FileResponse leaves quotes in ASCII filenames unescaped.
+    response['Content-Disposition'] = content_disposition(filename)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def document_response(request, document):
+    """Serves a TaskDocument with ETag, single Range support and optional offload to the web server."""
+    path = document.document.path
+    try:
+        etag = document_etag(document, path)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            filename = document.filename or os.path.basename(document.document.name)
+            if settings.DOCUMENT_SENDFILE_HEADER:
+                # nginx / Apache answer Range and conditional requests themselves.
+                response = _sendfile_response(document, path, filename)
+            else:
+                response = _file_response(request, path, filename, etag)
+    except FileNotFoundError:
+        raise Http404('Document file is missing')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, router, transaction
+from rest_framework import exceptions
+
+from authe.authentication import CachedJSONWebTokenAuthentication, decode_token
+from constants import CHANGE_DELETED
+from main import changelog
+from main.models import Project
+from utils import pubsub
+
+EVENTS_PATH = re.compile(r'^/main/projects/(?P<pk>\d+)/events/$')
+KEEPALIVE = b': keepalive\n\n'
+
+
+def channel(project_id):
+    return f'project:{project_id}'
+
+
+def publish(action, *instances):
+    """Queues server-sent events for tasks, comments or documents; they go out once the write commits.
+
+    Nothing is built when no subscriber can receive it, so processes without streams pay one check.
+    """
+    if not instances or not changelog.active() or not pubsub.broker().listening():
+        return
+    events = []
+    for instance in instances:
+        object_type = changelog.OBJECT_TYPES[type(instance)]
+        data = None
+        if action != CHANGE_DELETED:
+            deferred = instance.get_deferred_fields()
+            data = {field: getattr(instance, field) for field in changelog.FIELDS[object_type]
+                    if field not in deferred}
+        event = {'type': object_type, 'action': changelog.ACTIONS[action], 'id': instance.id,
+                 'version': instance.version, 'data': data}
+        project_id = changelog.known_project_id(instance)
+        parent = changelog.parent_key(instance) if project_id is None else None
+        events.append((project_id, parent, event))
+    using = router.db_for_write(type(instances[0]))
+    transaction.on_commit(lambda: _send(events), using=using)
+
+
+def _send(events):
+    broker = pubsub.broker()
+    # Parents that were not loaded are looked up together, not once per event.
+    found = changelog.project_ids({parent for project_id, parent, event in events if project_id is None})
+    for project_id, parent, event in events:
+        if project_id is None:
+            project_id = found.get(parent)
+            if project_id is None:
+                continue
+        # Encoded once here instead of once per subscriber.
+        message = (f"event: {event['type']}.{event['action']}\n"
+                   f"data: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n").encode('utf-8')
+        broker.publish(channel(project_id), message)
+
+
+def _token(scope):
+    headers = dict(scope.get('headers') or ())
+    prefix, _, token = headers.get(b'authorization', b'').decode('latin-1').partition(' ')
+    if prefix.lower() == 'jwt' and token:
+        return token
+    # EventSource cannot send headers, so browsers pass the token in the query string.
+    return (parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token') or [None])[0]
+
+
+def authorize(scope, project_id):
+    """(status, detail) for a stream request, checked like ProjectViewSet: any authenticated user."""
+    close_old_connections()
+    try:
+        token = _token(scope)
+        if token is None:
+            return 401, 'Authentication credentials were not provided.'
+        try:
+            CachedJSONWebTokenAuthentication().authenticate_credentials(decode_token(token))
+        except (jwt.InvalidTokenError, exceptions.AuthenticationFailed):
+            return 401, 'Invalid token.'
+        if not Project.objects.filter(id=project_id).exists():
+            return 404, 'Not found.'
+        return 200, None
+    finally:
+        close_old_connections()
+
+
+class EventStreamApplication:
+    """Serves ``/main/projects/<id>/events/`` as server-sent events and hands everything else to Django.
+
+    Each stream is one subscription on the pub/sub broker; an idle stream is a parked coroutine with
+    a bounded queue and a keepalive comment every EVENTS_KEEPALIVE_SECONDS.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = EVENTS_PATH.match(scope['path']) if scope['type'] == 'http' else None
+        if match is None:
+            return await self.application(scope, receive, send)
+        if scope['method'] != 'GET':
+            return await self.error(send, 405, 'Method not allowed.')
+        project_id = int(match['pk'])
+        status, detail = await sync_to_async(authorize)(scope, project_id)
+        if status != 200:
+            return await self.error(send, status, detail)
+        await self.stream(project_id, receive, send)
+
+    async def error(self, send, status, detail):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'detail': detail}).encode('utf-8')})
+
+    async def stream(self, project_id, receive, send):
+        subscription = pubsub.broker().subscribe(channel(project_id))
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        get = None
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                    (b'x-accel-buffering', b'no')]})
+            await send({'type': 'http.response.body', 'body': KEEPALIVE, 'more_body': True})
+            while True:
+                if get is None:
+                    get = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait({get, disconnected}, timeout=settings.EVENTS_KEEPALIVE_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    break
+                body = KEEPALIVE
+                if get in done:
+                    body, get = get.result(), None
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            subscription.close()
+            disconnected.cancel()
+            if get is not None:
+                get.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,81 @@
+import datetime as dt
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from authe.models import MainUser
+from main.models import Project, Block, Task, TaskComment
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seeds TaskComment rows inside a transaction that is rolled back, then compares the query plan and '
+            'timing of the old year/month/day window against the created_at range queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--tasks', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                task_ids = self.seed(options['rows'], options['tasks'], options['days'])
+                self.report(random.choice(task_ids), options['repeat'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded rows rolled back.')
+
+    def seed(self, rows, tasks, days):
+        user = MainUser.objects.create(username=f'benchmark-{time.time()}')
+        project = Project.objects.create(name='Benchmark', creator=user)
+        block = Block.objects.filter(project=project).first()
+        Task.objects.bulk_create(Task(name=f'Task {i}', priority=5, order=i, creator=user, block=block)
+                                 for i in range(tasks))
+        task_ids = list(Task.objects.filter(block=block).values_list('id', flat=True))
+
+        # created_at is auto_now_add, so rows go in through raw SQL to spread them over the time window.
+        now = timezone.now()
+        table = TaskComment._meta.db_table
+        sql = (f'INSERT INTO {table} (body, created_at, updated_at, version, creator_id, task_id) '
+               f'VALUES (%s, %s, %s, 1, %s, %s)')
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, 10000):
+                created = [now - dt.timedelta(seconds=random.randrange(days * 86400))
+                           for _ in range(min(10000, rows - offset))]
+                cursor.executemany(sql, [('benchmark', moment, moment, user.id, random.choice(task_ids))
+                                         for moment in created])
+        self.stdout.write(f'Seeded {rows} comments over {days} days in {time.perf_counter() - started:.1f}s')
+        return task_ids
+
+    def report(self, task_id, repeat):
+        today = timezone.now()
+        month_ago = today - dt.timedelta(days=30)
+        extract_window = TaskComment.objects.filter(
+            Q(created_at__year=today.year)
+            & ((Q(created_at__month=month_ago.month) & Q(created_at__day__gte=today.day))
+               | (Q(created_at__month=today.month) & Q(created_at__day__lte=today.day))))
+        queries = [
+            ('extract window (old last_month)', extract_window),
+            ('range window (last_month)', TaskComment.objects.last_month()),
+            ('task extract window', extract_window.filter(task_id=task_id)),
+            ('task range window', TaskComment.objects.filter(task_id=task_id).last_month()),
+            ('task since cursor', TaskComment.objects.filter(task_id=task_id).since(month_ago).by_date()[:50]),
+        ]
+        for label, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                count = len(list(queryset.values_list('id', flat=True)))
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(f'\n{label}: {count} rows, best of {repeat}: {min(timings) * 1000:.2f}ms')
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from django.test.utils import override_settings
+
+from authe.models import MainUser
+from main.models import Project, Block, Task, TaskComment
+
+SQLITE_MODES = {
+    'rollback': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 0},
+    'wal': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000},
+}
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent TaskComment/Task writes against the configured database and reports throughput '
+            'and lock errors. On SQLite every journal mode in --modes is compared.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=200, help='Writes per thread.')
+        parser.add_argument('--modes', nargs='+', choices=sorted(SQLITE_MODES), default=sorted(SQLITE_MODES))
+
+    def handle(self, *args, **options):
+        user = MainUser.objects.create(username=f'benchmark-{time.time()}')
+        project = Project.objects.create(name='Benchmark', creator=user)
+        block = Block.objects.filter(project=project).first()
+        task = Task.objects.create(name='Benchmark', priority=5, order=0, creator=user, block=block)
+        try:
+            if connection.vendor == 'sqlite':
+                for mode in options['modes']:
+                    with override_settings(SQLITE_PRAGMAS=SQLITE_MODES[mode]):
+                        connection.close()
+                        self.run(mode, task, options['threads'], options['writes'])
+            else:
+                self.run(connection.vendor, task, options['threads'], options['writes'])
+        finally:
+            connection.close()
+            user.delete()
+
+    def run(self, label, task, threads, writes):
+        errors = []
+
+        def worker():
+            try:
+                for i in range(writes):
+                    try:
+                        TaskComment.objects.create(body=f'benchmark {i}', creator_id=task.creator_id, task=task)
+                        if i % 10 == 0:
+                            Task.objects.filter(id=task.id).update(description=f'benchmark {i}')
+                    except OperationalError as error:
+                        errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done = threads * writes - len(errors)
+        self.stdout.write(f'{label}: {done} writes in {elapsed:.2f}s ({done / elapsed:.0f}/s), '
+                          f'{len(errors)} failed with lock errors')
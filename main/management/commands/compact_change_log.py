@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = ('Drops change log entries superseded by a newer entry for the same object and tombstones older '
+            'than --tombstone-days. Clients with older cursors get 410 Gone and resync.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tombstone-days', type=int, default=settings.CHANGE_LOG_TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        superseded, tombstones = ChangeLogEntry.objects.compact(options['tombstone_days'])
+        self.stdout.write(f'{superseded} superseded entries and {tombstones} tombstones deleted')
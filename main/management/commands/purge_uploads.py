@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = ('Fails chunked uploads with no activity for --hours and removes their part files from '
+            'UPLOAD_CHUNK_ROOT, including part files no upload refers to.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.UPLOAD_EXPIRY_HOURS)
+
+    def handle(self, *args, **options):
+        expired, removed = purge_expired(options['hours'])
+        self.stdout.write(f'{expired} uploads expired and {removed} part files removed')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = 'Drops and rebuilds the full-text search index for tasks, comments and documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = search.rebuild(options['batch_size'])
+        self.stdout.write(f'{total} search entries indexed')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized task/block/project counters and fixes rows that drifted.'
+
+    def handle(self, *args, **options):
+        for label, fixed in reconcile().items():
+            self.stdout.write(f'{label}: {fixed} fixed')
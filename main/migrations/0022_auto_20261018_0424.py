@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_auto_20191204_1904'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['block', 'order', 'id'], name='main_task_block_order_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BLOCK_DONE = 4
+
+
+def populate_counters(apps, schema_editor):
+    Project = apps.get_model('main', 'Project')
+    Block = apps.get_model('main', 'Block')
+    Task = apps.get_model('main', 'Task')
+    TaskComment = apps.get_model('main', 'TaskComment')
+    TaskDocument = apps.get_model('main', 'TaskDocument')
+
+    def count(model, path, **filters):
+        counts = model.objects.filter(**{path: OuterRef('pk')}, **filters).order_by() \
+            .values(path).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    Block.objects.update(tasks_count=count(Task, 'block'))
+    Project.objects.update(blocks_count=count(Block, 'project'),
+                           tasks_count=count(Task, 'block__project'),
+                           done_count=count(Task, 'block__project', block__block_type=BLOCK_DONE))
+    Task.objects.update(comments_count=count(TaskComment, 'task'), documents_count=count(TaskDocument, 'task'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_auto_20261018_0424'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='tasks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='blocks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='done_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tasks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='documents_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
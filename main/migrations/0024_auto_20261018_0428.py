@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_auto_20261018_0426'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_type', 'status'], name='main_project_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['creator', 'status'], name='main_proj_creator_status_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_auto_20261018_0428'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taskcomment',
+            index=models.Index(fields=['task', 'created_at'], name='main_comment_task_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskcomment',
+            index=models.Index(fields=['created_at'], name='main_comment_created_idx'),
+        ),
+    ]
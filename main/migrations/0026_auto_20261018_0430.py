@@ -0,0 +1,43 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import utils.upload
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0025_auto_20261018_0429'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskdocument',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='taskdocument',
+            name='thumbnail',
+            field=models.FileField(blank=True, null=True, upload_to=utils.upload.document_path),
+        ),
+        migrations.CreateModel(
+            name='DocumentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField()),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'PENDING'), (2, 'PROCESSING'), (3, 'DONE'), (4, 'FAILED')], default=1)),
+                ('error', models.CharField(blank=True, default='', max_length=250)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+                ('document', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='main.TaskDocument')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='main.Task')),
+            ],
+        ),
+    ]
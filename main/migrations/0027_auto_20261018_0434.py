@@ -0,0 +1,38 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:34
+
+import os
+
+from django.db import migrations, models
+
+
+def populate_filenames(apps, schema_editor):
+    TaskDocument = apps.get_model('main', 'TaskDocument')
+    documents = list(TaskDocument.objects.only('id', 'document'))
+    for document in documents:
+        document.filename = os.path.basename(document.document.name)
+    TaskDocument.objects.bulk_update(documents, ['filename'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_auto_20261018_0430'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='taskdocument',
+            name='filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(populate_filenames, migrations.RunPython.noop),
+    ]
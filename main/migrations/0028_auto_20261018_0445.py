@@ -0,0 +1,54 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:45
+
+from django.db import migrations
+
+# Entry ids are object_id * 4 + kind (1 task, 2 comment, 3 document), as in main.search.entry_id.
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE main_search_index USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, task_id UNINDEXED, title UNINDEXED, body, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO main_search_index (rowid, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 1, 1, id, id, name, name || ' ' || COALESCE(description, '') FROM main_task",
+    "INSERT INTO main_search_index (rowid, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 2, 2, id, task_id, substr(body, 1, 255), body FROM main_taskcomment",
+    "INSERT INTO main_search_index (rowid, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 3, 3, id, task_id, filename, filename FROM main_taskdocument",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE main_search_index (id bigint PRIMARY KEY, kind smallint NOT NULL, object_id integer NOT NULL, "
+    "task_id integer NOT NULL, title varchar(255) NOT NULL, body tsvector NOT NULL)",
+    "CREATE INDEX main_search_index_body_idx ON main_search_index USING GIN (body)",
+    "INSERT INTO main_search_index (id, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 1, 1, id, id, name, setweight(to_tsvector('simple', name), 'A') || "
+    "setweight(to_tsvector('simple', COALESCE(description, '')), 'B') FROM main_task",
+    "INSERT INTO main_search_index (id, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 2, 2, id, task_id, left(body, 255), setweight(to_tsvector('simple', body), 'A') "
+    "FROM main_taskcomment",
+    "INSERT INTO main_search_index (id, kind, object_id, task_id, title, body) "
+    "SELECT id * 4 + 3, 3, id, task_id, filename, setweight(to_tsvector('simple', filename), 'A') "
+    "FROM main_taskdocument",
+]
+
+FORWARD = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in FORWARD.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in FORWARD:
+        schema_editor.execute('DROP TABLE main_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_auto_20261018_0434'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
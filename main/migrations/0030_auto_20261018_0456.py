@@ -0,0 +1,42 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_auto_20261018_0451'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCompaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizon', models.BigIntegerField()),
+                ('removed', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('project_id', models.PositiveIntegerField()),
+                ('object_type', models.CharField(max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'CREATED'), (2, 'UPDATED'), (3, 'DELETED')])),
+                ('version', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['project_id', 'id'], name='main_change_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['object_type', 'object_id'], name='main_change_object_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.7 on 2026-10-18 05:16
+
+from django.db import migrations
+import utils.storage
+import utils.upload
+import utils.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_auto_20261018_0456'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskdocument',
+            name='document',
+            field=utils.storage.ContentAddressedFileField(upload_to=utils.upload.document_path, validators=[utils.validators.validate_file_size, utils.validators.validate_extension]),
+        ),
+        migrations.AlterField(
+            model_name='taskdocument',
+            name='thumbnail',
+            field=utils.storage.ContentAddressedFileField(blank=True, null=True, upload_to=utils.upload.document_path),
+        ),
+    ]
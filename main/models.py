@@ -1,12 +1,20 @@
 from authe.models import MainUser
 from constants import PROJECT_STATUSES, PROJECT_IN_PROCESS, PROJECT_TYPES, PROJECT_DEVELOPMENT, PROJECT_DONE, \
-    PROJECT_FROZEN, PROJECT_OPTIMIZATION, BLOCK_TYPES, BLOCK_BACKLOG
-from django.db import models
+    PROJECT_FROZEN, PROJECT_OPTIMIZATION, BLOCK_TYPES, BLOCK_BACKLOG, TASK_ORDER_GAP, UPLOAD_STATUSES, UPLOAD_PENDING, \
+    CHANGE_ACTIONS, CHANGE_DELETED
+from django.conf import settings
+from django.db import models, router, transaction, IntegrityError
+from django.utils import timezone
 from django.db.models import F, Q, Count, Avg, Max, Min, Sum
+from utils.background import background
+from utils.other import type_display_name
+from utils.storage import ContentAddressedFileField
 from utils.upload import document_path
 from utils.validators import validate_extension, validate_file_size
 
 import datetime as dt
+import os
+import uuid
 
 
 class IntegerRangeField(models.IntegerField):
@@ -20,10 +28,75 @@ class IntegerRangeField(models.IntegerField):
         return super(IntegerRangeField, self).formfield(**defaults)
 
 
-class ProjectManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().filter(project_type=PROJECT_OPTIMIZATION)
+class CounterFieldsMixin:
+    """Keeps full saves from writing stale copies of the counters main.counters maintains with F() updates."""
+    counter_fields = ()
 
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and not kwargs.get('force_insert') \
+                and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields
+                                       and field.attname not in deferred]
+        super().save(*args, **kwargs)
+
+
+def touched(**updates):
+    """``queryset.update()`` kwargs that also move the validators, since update() skips auto_now and save()."""
+    return dict(updates, updated_at=timezone.now(), version=F('version') + 1)
+
+
+def bulk_touch(objs, fields, batch_size=None):
+    """``bulk_update()`` of ``fields`` that bumps the stored versions like save() does, then reads them back.
+
+    Run it inside a transaction: receivers of the bulk signals log and publish the versions read back.
+    """
+    if not objs:
+        return
+    model, now = type(objs[0]), timezone.now()
+    for obj in objs:
+        obj.updated_at, obj.version = now, F('version') + 1
+    model._base_manager.bulk_update(objs, [*fields, *model.version_fields], batch_size=batch_size)
+    ids = [obj.pk for obj in objs]
+    size = batch_size or len(ids)
+    versions = {}
+    for start in range(0, len(ids), size):
+        versions.update(model._base_manager.filter(pk__in=ids[start:start + size]).values_list('pk', 'version'))
+    for obj in objs:
+        obj.version = versions[obj.pk]
+
+
+class VersionedBase(models.Model):
+    """Modification time and a counter bumped on every save; conditional GETs are computed from both."""
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    version_fields = ('updated_at', 'version')
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.version_fields}
+        # post_save receivers write counters and the change log; they commit or roll back with the row.
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # The stored version is bumped rather than the in-memory one, which is stale after F() touches.
+        values = [(field, model, F('version') + 1 if field.name == 'version' else value)
+                  for field, model, value in values]
+        updated = super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if updated:
+            # Read back before post_save, whose receivers log and publish the new version.
+            self.version = base_qs.filter(pk=pk_val).values_list('version', flat=True).get()
+        return updated
+
+
+class ProjectQuerySet(models.QuerySet):
     def optimization_projects(self):
         return self.filter(project_type=PROJECT_OPTIMIZATION)
 
@@ -45,8 +118,15 @@ class ProjectManager(models.Manager):
     def filter_by_status(self, status):
         return self.filter(status=status)
 
+    def filter_by_creator(self, creator):
+        return self.filter(creator=creator)
+
     def avg_blocks(self):
-        return self.aggregate(Avg('blocks'))
+        return self.aggregate(blocks__avg=Avg('blocks_count'))
+
+
+class ProjectManager(models.Manager.from_queryset(ProjectQuerySet)):
+    pass
 
 
 class DescBase(models.Model):
@@ -56,26 +136,71 @@ class DescBase(models.Model):
         abstract = True
 
 
-class Project(DescBase):
+class Project(CounterFieldsMixin, DescBase, VersionedBase):
     name = models.CharField(max_length=100, blank=False, null=False)
     status = models.PositiveSmallIntegerField(choices=PROJECT_STATUSES, default=PROJECT_IN_PROCESS)
     project_type = models.PositiveSmallIntegerField(choices=PROJECT_TYPES, default=PROJECT_DEVELOPMENT)
     creator = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='projects')
+    blocks_count = models.PositiveIntegerField(default=0, editable=False)
+    tasks_count = models.PositiveIntegerField(default=0, editable=False)
+    done_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('blocks_count', 'tasks_count', 'done_count')
 
     objects = ProjectManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_type', 'status'], name='main_project_type_status_idx'),
+            models.Index(fields=['creator', 'status'], name='main_proj_creator_status_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        from main import changelog
+        from main.counters import counters_suspended
+        # One tombstone for the project instead of one per block, task, comment and document.
+        with transaction.atomic(using=router.db_for_write(Project, instance=self)):
+            changelog.record(CHANGE_DELETED, self)
+            with counters_suspended(), changelog.suspended():
+                return super().delete(*args, **kwargs)
+
 
-class Block(models.Model):
+class Block(CounterFieldsMixin, VersionedBase):
     name = models.CharField(max_length=100, blank=True, null=True)
     block_type = models.PositiveSmallIntegerField(choices=BLOCK_TYPES, default=BLOCK_BACKLOG)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='blocks')
+    tasks_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('tasks_count',)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.name and self.block_type:
+            self.name = type_display_name(BLOCK_TYPES, self.block_type)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_block_type = instance.__dict__.get('block_type')
+        return instance
+
+    def delete(self, *args, **kwargs):
+        from main.counters import counters_suspended, counters_active, remove_block
+        active = counters_active()
+        if active:
+            tasks_count = Block.objects.filter(id=self.id).values_list('tasks_count', flat=True).first() or 0
+        with counters_suspended():
+            result = super().delete(*args, **kwargs)
+        if active:
+            remove_block(self.project_id, self.block_type, tasks_count)
+        return result
+
 
 class TaskManager(models.Manager):
     def done_user(self, user):
@@ -94,38 +219,127 @@ class TaskManager(models.Manager):
         return self.filter(priority__gte=7)
 
     def documents_count(self):
-        return self.annotate(documents_count=Count('documents'))
+        return self.all()
 
     def documents_comments_count(self):
-        return self.annotate(Count('documents'), Count('comments'))
+        return self.annotate(documents__count=F('documents_count'), comments__count=F('comments_count'))
 
     def comments_grouped_by_name(self):
-        return self.values('name').annotate(Count('comments'))
+        return self.values('name').annotate(comments__count=Sum('comments_count'))
 
     def documents_gte_comments(self):
         return self.filter(documents_count__gte=F('comments_count'))
 
-
-class Task(DescBase):
+    def in_block(self, block):
+        return self.filter(block=block).order_by('order', 'id')
+
+    def next_order(self, block):
+        last = self.filter(block=block).aggregate(last=Max('order'))['last']
+        return TASK_ORDER_GAP if last is None else last + TASK_ORDER_GAP
+
+    def place(self, task, block, after=None):
+        """Moves ``task`` into ``block`` right behind ``after`` (or to the top), writing only that row.
+
+        Orders are kept TASK_ORDER_GAP apart, so the new order is the midpoint of its neighbours.
+        The column is renumbered synchronously only when two neighbours are adjacent integers, and
+        in the background as soon as a gap runs low.
+        """
+        siblings = self.filter(block=block).exclude(id=task.id)
+        lower = after.order if after is not None else None
+        # Siblings sort by (order, id); bulk updates can leave ties, which the rebalance below splits.
+        following = siblings.filter(Q(order__gt=lower) | Q(order=lower, id__gt=after.id)) \
+            if lower is not None else siblings
+        upper = following.order_by('order', 'id').values_list('order', flat=True).first()
+
+        if lower is not None and upper is not None and upper - lower < 2:
+            self.rebalance(block.id, exclude=task.id)
+            after.refresh_from_db(fields=['order'])
+            return self.place(task, block, after)
+
+        if lower is None and upper is None:
+            order = TASK_ORDER_GAP
+        elif lower is None:
+            order = upper - TASK_ORDER_GAP
+        elif upper is None:
+            order = lower + TASK_ORDER_GAP
+        else:
+            order = (lower + upper) // 2
+            if min(order - lower, upper - order) < 2:
+                background.submit(self.rebalance, block.id)
+
+        task.block = block
+        task.order = order
+        task.save(update_fields=['block', 'order'])
+        return task
+
+    def rebalance(self, block_id, exclude=None):
+        """Renumbers a column with evenly spaced orders, keeping the current sequence."""
+        with transaction.atomic():
+            tasks = list(self.filter(block_id=block_id).exclude(id=exclude).order_by('order', 'id')
+                         .only('id', 'block', 'order'))
+            changed = []
+            for position, task in enumerate(tasks, start=1):
+                if task.order != position * TASK_ORDER_GAP:
+                    task.order = position * TASK_ORDER_GAP
+                    changed.append(task)
+            bulk_touch(changed, ['order'], batch_size=500)
+
+            from main.signals import tasks_bulk_updated
+            tasks_bulk_updated.send(sender=self.model, tasks=changed, block_ids={block_id}, fields=['order'])
+        return len(changed)
+
+
+class Task(CounterFieldsMixin, DescBase, VersionedBase):
     name = models.CharField(max_length=100, blank=False, null=False)
     priority = IntegerRangeField(min_value=1, max_value=10, null=False)
     order = models.IntegerField(null=False)
     creator = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='%(class)s_creator')
     executor = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='%(class)s_executor', null=True)
     block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name='tasks')
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    documents_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('comments_count', 'documents_count')
 
     objects = TaskManager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_block_id = self.block_id
+
+    def delete(self, *args, **kwargs):
+        from main.counters import counters_suspended, counters_active, add_tasks
+        active = counters_active()
+        with counters_suspended():
+            result = super().delete(*args, **kwargs)
+        if active:
+            add_tasks(self.block_id, -1, self.block if Task.block.is_cached(self) else None)
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the block the task was loaded from so moves can be detected on save.
+        instance._loaded_block_id = instance.__dict__.get('block_id')
+        instance._loaded_text = (instance.__dict__.get('name'), instance.__dict__.get('description'))
+        return instance
+
     class Meta:
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
+        indexes = [
+            models.Index(fields=['block', 'order', 'id'], name='main_task_block_order_idx'),
+        ]
 
 
-class TaskDocument(models.Model):
-    document = models.FileField(upload_to=document_path, validators=[validate_file_size, validate_extension])
+class TaskDocument(VersionedBase):
+    document = ContentAddressedFileField(upload_to=document_path, validators=[validate_file_size, validate_extension])
+    filename = models.CharField(max_length=255, blank=True, default='')
+    thumbnail = ContentAddressedFileField(upload_to=document_path, null=True, blank=True)
+    checksum = models.CharField(max_length=64, blank=True, default='')
     creator = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='documents')
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='documents')
 
@@ -133,24 +347,152 @@ class TaskDocument(models.Model):
         verbose_name = 'TaskDocument'
         verbose_name_plural = 'TaskDocuments'
 
+    def save(self, *args, **kwargs):
+        # Stored names are content hashes, so the uploaded name is kept separately.
+        if not self.filename and self.document:
+            self.filename = os.path.basename(self.document.name)
+        super().save(*args, **kwargs)
+
+
+class DocumentUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    status = models.PositiveSmallIntegerField(choices=UPLOAD_STATUSES, default=UPLOAD_PENDING)
+    error = models.CharField(max_length=250, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    creator = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='uploads')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='uploads')
+    document = models.OneToOneField(TaskDocument, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='upload')
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.UPLOAD_CHUNK_ROOT, f'{self.id}.part')
+
+
+class BlobManager(models.Manager):
+    def acquire(self, name, size):
+        if self.filter(name=name).update(refs=F('refs') + 1):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, size=size, refs=1)
+        except IntegrityError:
+            self.filter(name=name).update(refs=F('refs') + 1)
+
+    def release(self, name):
+        """Drops one reference and tells whether the file itself can go.
+
+        Files saved before content addressing have no Blob row and are always removed.
+        """
+        with transaction.atomic():
+            blob = self.select_for_update().filter(name=name).first()
+            if blob is None:
+                return True
+            if blob.refs > 1:
+                self.filter(name=name).update(refs=F('refs') - 1)
+                return False
+            blob.delete()
+            return True
+
+
+class Blob(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    size = models.PositiveIntegerField()
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+
+class TaskCommentQuerySet(models.QuerySet):
+    def last_days(self, days, now=None):
+        now = now or timezone.now()
+        return self.filter(created_at__gte=now - dt.timedelta(days=days), created_at__lte=now)
 
-class TaskCommentManager(models.Manager):
     def last_month(self):
-        today = dt.datetime.now()
-        month_ago = today - dt.timedelta(days=30)
-        return self.filter(Q(created_at__year=today.year)
-                           & ((Q(created_at__month=month_ago.month) & Q(created_at__day__gte=today.day))
-                              | (Q(created_at__month=today.month) & Q(created_at__day__lte=today.day))))
+        return self.last_days(30)
+
+    def between(self, start, end):
+        return self.filter(created_at__gte=start, created_at__lt=end)
+
+    def since(self, moment):
+        return self.filter(created_at__gt=moment)
 
     def by_date(self):
         return self.all().order_by('-created_at')
 
 
-class TaskComment(models.Model):
+class TaskCommentManager(models.Manager.from_queryset(TaskCommentQuerySet)):
+    pass
+
+
+class TaskComment(VersionedBase):
     body = models.CharField(max_length=300, blank=False, null=False)
-    created_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     creator = models.ForeignKey(MainUser, on_delete=models.CASCADE, related_name='comments')
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='comments')
 
     objects = TaskCommentManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'created_at'], name='main_comment_task_created_idx'),
+            models.Index(fields=['created_at'], name='main_comment_created_idx'),
+        ]
+
+
+class ChangeLogEntryManager(models.Manager):
+    def horizon(self):
+        """Cursors below this id may have missed compacted tombstones and have to resync."""
+        return ChangeLogCompaction.objects.aggregate(horizon=Max('horizon'))['horizon'] or 0
+
+    def compact(self, tombstone_days):
+        """Keeps only the newest entry per object and drops tombstones older than ``tombstone_days``.
+
+        Feed entries carry the current row, so superseded entries add nothing. Dropping tombstones
+        does lose information; the highest dropped id is recorded as the new horizon.
+        Returns (superseded entries removed, tombstones removed).
+        """
+        with transaction.atomic():
+            latest = self.order_by().values('object_type', 'object_id').annotate(last=Max('id')).values('last')
+            superseded, _ = self.exclude(id__in=latest).delete()
+            tombstones = self.filter(action=CHANGE_DELETED,
+                                     created_at__lt=timezone.now() - dt.timedelta(days=tombstone_days))
+            horizon = tombstones.aggregate(horizon=Max('id'))['horizon']
+            removed = 0
+            if horizon is not None:
+                removed, _ = tombstones.filter(id__lte=horizon).delete()
+                ChangeLogCompaction.objects.create(horizon=horizon, removed=removed)
+        return superseded, removed
+
+
+class ChangeLogEntry(models.Model):
+    """Append-only feed of creates, updates and deletes per project; the id is the sync cursor."""
+    id = models.BigAutoField(primary_key=True)
+    project_id = models.PositiveIntegerField()
+    object_type = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    action = models.PositiveSmallIntegerField(choices=CHANGE_ACTIONS)
+    version = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ChangeLogEntryManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_id', 'id'], name='main_change_project_idx'),
+            models.Index(fields=['object_type', 'object_id'], name='main_change_object_idx'),
+        ]
+
+
+class ChangeLogCompaction(models.Model):
+    horizon = models.BigIntegerField()
+    removed = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
@@ -0,0 +1,21 @@
+from utils.pagination import DefaultCursorPagination
+
+
+class ProjectCursorPagination(DefaultCursorPagination):
+    ordering = ('-id',)
+
+
+class BlockCursorPagination(DefaultCursorPagination):
+    ordering = ('id',)
+
+
+class TaskCursorPagination(DefaultCursorPagination):
+    ordering = ('order', 'id')
+
+
+class TaskCommentCursorPagination(DefaultCursorPagination):
+    ordering = ('-created_at', 'id')
+
+
+class TaskDocumentCursorPagination(DefaultCursorPagination):
+    ordering = ('-id',)
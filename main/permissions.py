@@ -1,6 +1,46 @@
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from authe.models import MainUser
 
+OWNER_PATHS = {
+    'main.Block': ('project__creator_id',),
+    'main.Task': ('creator_id', 'block__project__creator_id'),
+    'main.TaskComment': ('creator_id', 'task__creator_id', 'task__block__project__creator_id'),
+    'main.TaskDocument': ('creator_id', 'task__creator_id', 'task__block__project__creator_id'),
+}
+
+_MISSING = object()
+
+
+def _cached_value(obj, path):
+    *relations, attname = path.split('__')
+    for name in relations:
+        field = obj._meta.get_field(name)
+        if not field.is_cached(obj):
+            return _MISSING
+        obj = field.get_cached_value(obj)
+        if obj is None:
+            return None
+    return obj.__dict__.get(attname, _MISSING)
+
+
+def owner_ids(request, obj):
+    """Returns the creator ids along obj's ownership chain (e.g. comment -> task -> project).
+
+    Ids come from relations already loaded on obj, otherwise from a single values query, and are
+    memoized on the request so repeated object checks cost nothing.
+    """
+    memo = getattr(request, '_owner_ids', None)
+    if memo is None:
+        memo = request._owner_ids = {}
+    key = (obj._meta.label, obj.pk)
+    if key not in memo:
+        paths = OWNER_PATHS[obj._meta.label]
+        ids = tuple(_cached_value(obj, path) for path in paths)
+        if _MISSING in ids:
+            ids = type(obj)._base_manager.filter(pk=obj.pk).values_list(*paths).first() or ()
+        memo[key] = frozenset(ids)
+    return memo[key]
+
 
 class IsOwner(IsAuthenticated):
     message = 'You must be the owner.'
@@ -21,8 +61,8 @@ class BlockPermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
-        if view.action is not 'list':
-            return request.user == obj.project.creator
+        if view.action != 'list':
+            return request.user.id in owner_ids(request, obj)
 
 
 class TaskPermission(BasePermission):
@@ -37,7 +77,7 @@ class TaskPermission(BasePermission):
         if view.action in ['list', 'create']:
             return True
         if view.action not in ['list', 'create']:
-            return request.user in [obj.block.project.creator, obj.creator]
+            return request.user.id in owner_ids(request, obj)
 
 
 class TaskInsidePermission(BasePermission):
@@ -49,7 +89,7 @@ class TaskInsidePermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
-        if view.action is 'list':
+        if view.action == 'list':
             return True
-        if view.action is not 'list':
-            return request.user in [obj.task.creator, obj.task.block.project.creator, obj.creator]
+        if view.action != 'list':
+            return request.user.id in owner_ids(request, obj)
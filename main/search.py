@@ -0,0 +1,163 @@
+import re
+
+from django.db import connections, router
+
+from main.models import Task, TaskComment, TaskDocument
+
+SEARCH_TABLE = 'main_search_index'
+
+KIND_TASK, KIND_COMMENT, KIND_DOCUMENT = 1, 2, 3
+KINDS = {KIND_TASK: 'task', KIND_COMMENT: 'comment', KIND_DOCUMENT: 'document'}
+KIND_IDS = {name: kind for kind, name in KINDS.items()}
+_MODEL_KINDS = {Task: KIND_TASK, TaskComment: KIND_COMMENT, TaskDocument: KIND_DOCUMENT}
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# Hits are only returned for tasks the user created or whose project they own, like TaskPermission.
+_ACCESS_JOIN = '''
+    JOIN main_task t ON t.id = s.task_id
+    JOIN main_block b ON b.id = t.block_id
+    JOIN main_project p ON p.id = b.project_id
+'''
+
+
+def entry_id(kind, object_id):
+    """One integer key per indexed row, so updates and deletes are primary key lookups."""
+    return object_id * 4 + kind
+
+
+def entry_for(instance):
+    """(id, kind, object_id, task_id, title, primary text, secondary text) for a Task, comment or document."""
+    kind = _MODEL_KINDS[type(instance)]
+    if kind == KIND_TASK:
+        return entry_id(kind, instance.id), kind, instance.id, instance.id, instance.name, instance.name, \
+            instance.description or ''
+    if kind == KIND_COMMENT:
+        return entry_id(kind, instance.id), kind, instance.id, instance.task_id, instance.body[:255], \
+            instance.body, ''
+    return entry_id(kind, instance.id), kind, instance.id, instance.task_id, instance.filename, \
+        instance.filename, ''
+
+
+class SQLiteBackend:
+    """FTS5 table; kind/object_id/task_id/title ride along UNINDEXED and the rowid is the entry id."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def match(self, text):
+        return ' '.join(f'"{term}"*' for term in _TERM_RE.findall(text))
+
+    def upsert(self, entries):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(entry[0],) for entry in entries])
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, task_id, title, body) '
+                f'VALUES (%s, %s, %s, %s, %s, %s)',
+                [(id_, kind, object_id, task_id, title, f'{primary} {secondary}')
+                 for id_, kind, object_id, task_id, title, primary, secondary in entries])
+
+    def delete(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(id_,) for id_ in ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search_sql(self, where):
+        # FTS5 tables cannot be aliased in MATCH/bm25(), so the match runs in a subquery.
+        return (f'SELECT s.kind, s.object_id, s.task_id, s.title, b.project_id, s.score '
+                f'FROM (SELECT rowid, kind, object_id, task_id, title, -bm25({SEARCH_TABLE}) AS score '
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s) s {_ACCESS_JOIN} WHERE {where} '
+                f'ORDER BY s.score DESC, s.rowid LIMIT %s OFFSET %s')
+
+
+class PostgresBackend:
+    """Weighted tsvector column with a GIN index; the task name/comment body weighs more than the rest."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def match(self, text):
+        return ' & '.join(f'{term}:*' for term in _TERM_RE.findall(text))
+
+    def upsert(self, entries):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (id, kind, object_id, task_id, title, body) VALUES "
+                f"(%s, %s, %s, %s, %s, setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'B')) "
+                f"ON CONFLICT (id) DO UPDATE SET task_id = EXCLUDED.task_id, title = EXCLUDED.title, "
+                f"body = EXCLUDED.body", entries)
+
+    def delete(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE id = ANY(%s)', [list(ids)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def search_sql(self, where):
+        return (f"SELECT s.kind, s.object_id, s.task_id, s.title, b.project_id, ts_rank(s.body, q) AS score "
+                f"FROM {SEARCH_TABLE} s CROSS JOIN to_tsquery('simple', %s) q {_ACCESS_JOIN} "
+                f"WHERE s.body @@ q AND {where} ORDER BY score DESC, s.id LIMIT %s OFFSET %s")
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}
+
+
+def backend(for_write=True):
+    alias = router.db_for_write(Task) if for_write else router.db_for_read(Task)
+    connection = connections[alias]
+    return BACKENDS[connection.vendor](connection)
+
+
+def index(*instances):
+    backend().upsert([entry_for(instance) for instance in instances])
+
+
+def remove(*instances):
+    backend().delete([entry_id(_MODEL_KINDS[type(instance)], instance.id) for instance in instances])
+
+
+def search(user, text, project=None, kind=None, limit=20, offset=0):
+    """Ranked hits as dicts; an empty list when ``text`` has no searchable terms."""
+    search_backend = backend(for_write=False)
+    match = search_backend.match(text)
+    if not match:
+        return []
+    where, params = ['(t.creator_id = %s OR p.creator_id = %s)'], [user.id, user.id]
+    if project is not None:
+        where.append('b.project_id = %s')
+        params.append(project)
+    if kind is not None:
+        where.append('s.kind = %s')
+        params.append(KIND_IDS[kind])
+    with search_backend.connection.cursor() as cursor:
+        cursor.execute(search_backend.search_sql(' AND '.join(where)), [match, *params, limit, offset])
+        rows = cursor.fetchall()
+    return [{'type': KINDS[kind], 'id': object_id, 'task': task_id, 'project': project_id, 'title': title,
+             'score': score} for kind, object_id, task_id, title, project_id, score in rows]
+
+
+def rebuild(batch_size=1000):
+    """Re-indexes every task, comment and document; returns the number of entries written."""
+    search_backend = backend()
+    search_backend.clear()
+    total = 0
+    querysets = (Task.objects.only('id', 'name', 'description'),
+                 TaskComment.objects.only('id', 'task_id', 'body'),
+                 TaskDocument.objects.only('id', 'task_id', 'filename'))
+    for queryset in querysets:
+        batch = []
+        for instance in queryset.order_by('id').iterator(chunk_size=batch_size):
+            batch.append(entry_for(instance))
+            if len(batch) == batch_size:
+                search_backend.upsert(batch)
+                total += len(batch)
+                batch = []
+        search_backend.upsert(batch)
+        total += len(batch)
+    return total
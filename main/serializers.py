@@ -1,7 +1,28 @@
-from main.models import Project, Block, Task, TaskComment, TaskDocument
+from main.models import Project, Block, Task, TaskComment, TaskDocument, DocumentUpload
 from rest_framework import serializers
 from authe.serializers import UserSerializer
-from constants import PROJECT_STATUSES, PROJECT_TYPES, BLOCK_TYPES
+from constants import PROJECT_STATUSES, PROJECT_TYPES, BLOCK_TYPES, UPLOAD_STATUSES
+from utils.validators import validate_filename, validate_size
+from django.conf import settings
+from django.urls import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
+
+
+class EagerLoadingMixin:
+    """Declares the relations a serializer dereferences so views can load them upfront."""
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    only_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        return queryset
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -10,14 +31,19 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ProjectListSerializer(serializers.ModelSerializer):
+class ProjectListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator',)
+    only_fields = ('id', 'name', 'description', 'status', 'project_type', 'blocks_count', 'tasks_count', 'done_count',
+                   'updated_at', 'version', 'creator__username')
+
     status_name = serializers.SerializerMethodField()
     project_type_name = serializers.SerializerMethodField()
     creator_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Project
-        fields = ('id', 'name', 'description', 'status_name', 'project_type_name', 'creator_name')
+        fields = ('id', 'name', 'description', 'status_name', 'project_type_name', 'creator_name', 'blocks_count',
+                  'tasks_count', 'done_count')
 
     def get_status_name(self, obj):
         if obj.status is not None:
@@ -35,6 +61,34 @@ class ProjectListSerializer(serializers.ModelSerializer):
         return ''
 
 
+class ProjectFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=PROJECT_STATUSES, required=False)
+    type = serializers.ChoiceField(choices=PROJECT_TYPES, required=False)
+    creator = serializers.IntegerField(required=False)
+
+    def filter_queryset(self, queryset):
+        if 'status' in self.validated_data:
+            queryset = queryset.filter_by_status(self.validated_data['status'])
+        if 'type' in self.validated_data:
+            queryset = queryset.filter_by_project_type(self.validated_data['type'])
+        if 'creator' in self.validated_data:
+            queryset = queryset.filter_by_creator(self.validated_data['creator'])
+        return queryset
+
+
+class ChangeFeedSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.CHANGE_LOG_PAGE_SIZE, default=100)
+
+
+class SearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    project = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(choices=('task', 'comment', 'document'), required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
 class ProjectCreateSerializer(serializers.ModelSerializer):
     status = serializers.IntegerField()
     project_type = serializers.IntegerField()
@@ -61,20 +115,27 @@ class ProjectCreateSerializer(serializers.ModelSerializer):
 
 
 class ProjectDetailedSerializer(ProjectListSerializer):
+    select_related_fields = ('creator',)
+    only_fields = ()
+
     creator = UserSerializer()
 
     class Meta:
         model = Project
-        fields = ('id', 'name', 'description', 'status_name', 'project_type_name', 'creator')
+        fields = ('id', 'name', 'description', 'status_name', 'project_type_name', 'creator', 'blocks_count',
+                  'tasks_count', 'done_count')
+
 
+class BlockListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('project',)
+    only_fields = ('id', 'name', 'block_type', 'tasks_count', 'project__name')
 
-class BlockListSerializer(serializers.ModelSerializer):
     project_name = serializers.SerializerMethodField()
     block_type_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Block
-        fields = ('id', 'name', 'block_type_name', 'project_name')
+        fields = ('id', 'name', 'block_type_name', 'project_name', 'tasks_count')
 
     def get_project_name(self, obj):
         if obj.project is not None:
@@ -104,21 +165,29 @@ class BlockCreateSerializer(serializers.Serializer):
 
 
 class BlockDetailSerializer(BlockListSerializer):
+    select_related_fields = ('project__creator',)
+    only_fields = ()
+
     project = ProjectListSerializer(read_only=True)
 
     class Meta:
         model = Block
-        fields = ('id', 'name', 'block_type_name', 'project')
+        fields = ('id', 'name', 'block_type_name', 'project', 'tasks_count')
+
 
+class TaskListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator', 'executor', 'block')
+    only_fields = ('id', 'name', 'description', 'priority', 'order', 'comments_count', 'documents_count',
+                   'creator__username', 'executor__username', 'block__name')
 
-class TaskListSerializer(serializers.ModelSerializer):
     creator_name = serializers.SerializerMethodField()
     block_name = serializers.SerializerMethodField()
     executor_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Task
-        fields = ('id', 'name', 'description', 'priority', 'order', 'block_name', 'creator_name', 'executor_name')
+        fields = ('id', 'name', 'description', 'priority', 'order', 'block_name', 'creator_name', 'executor_name',
+                  'comments_count', 'documents_count')
 
     def get_creator_name(self, obj):
         if obj.creator is not None:
@@ -138,6 +207,7 @@ class TaskListSerializer(serializers.ModelSerializer):
 
 class TaskCreateSerializer(serializers.ModelSerializer):
     priority = serializers.IntegerField()
+    order = serializers.IntegerField(required=False)
     creator = UserSerializer(read_only=True)
     block = BlockListSerializer(read_only=True)
 
@@ -156,7 +226,9 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         return value
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator', 'block__project')
+
     creator = UserSerializer(read_only=True)
     block = BlockListSerializer(read_only=True)
 
@@ -165,7 +237,28 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class TaskCommentListSerializer(serializers.ModelSerializer):
+class TaskMoveSerializer(serializers.Serializer):
+    block = serializers.IntegerField()
+    after = serializers.IntegerField(required=False, allow_null=True)
+
+
+class TaskBulkUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    block = serializers.IntegerField(required=False)
+    order = serializers.IntegerField(required=False)
+    priority = serializers.IntegerField(required=False)
+    executor = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_priority(self, value):
+        if value > 10 or value < 1:
+            raise serializers.ValidationError('Task priority can be between 1 and 10')
+        return value
+
+
+class TaskCommentListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator', 'task')
+    only_fields = ('id', 'body', 'created_at', 'creator__username', 'task__name')
+
     creator_name = serializers.SerializerMethodField()
     task_name = serializers.SerializerMethodField()
 
@@ -184,7 +277,9 @@ class TaskCommentListSerializer(serializers.ModelSerializer):
         return ''
 
 
-class TaskCommentSerializer(serializers.ModelSerializer):
+class TaskCommentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator', 'task__creator', 'task__block__project')
+
     creator = UserSerializer(read_only=True)
     task = TaskSerializer(read_only=True)
 
@@ -193,14 +288,17 @@ class TaskCommentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class TaskDocumentListSerializer(serializers.ModelSerializer):
+class TaskDocumentListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('creator', 'task')
+    only_fields = ('id', 'document', 'filename', 'creator__username', 'task__name')
+
     creator_name = serializers.SerializerMethodField()
     task_name = serializers.SerializerMethodField()
     document_full = serializers.SerializerMethodField()
 
     class Meta:
         model = TaskDocument
-        fields = ('id', 'document_full', 'creator_name', 'task_name')
+        fields = ('id', 'filename', 'document_full', 'creator_name', 'task_name')
 
     def get_creator_name(self, obj):
         if obj.creator is not None:
@@ -213,10 +311,40 @@ class TaskDocumentListSerializer(serializers.ModelSerializer):
         return ''
 
     def get_document_full(self, obj):
-        return self.context.get('base_url')[:-1] + obj.document.url
+        url = reverse('taskdocument-download', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
 
+class TaskDocumentSerializer(EagerLoadingMixin, serializers.Serializer):
+    select_related_fields = ('creator', 'task__creator', 'task__block__project')
 
-class TaskDocumentSerializer(serializers.Serializer):
     creator = UserSerializer(read_only=True)
     task = TaskSerializer(read_only=True)
-    document = serializers.FileField()
\ No newline at end of file
+    document = serializers.FileField()
+
+
+class DocumentUploadSerializer(serializers.ModelSerializer):
+    status_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DocumentUpload
+        fields = ('id', 'task', 'filename', 'size', 'received', 'status_name', 'error', 'document')
+        read_only_fields = ('received', 'error', 'document')
+
+    def get_status_name(self, obj):
+        return UPLOAD_STATUSES[obj.status-1][1]
+
+    def validate_filename(self, value):
+        try:
+            validate_filename(value)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return value
+
+    def validate_size(self, value):
+        try:
+            validate_size(value)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return value
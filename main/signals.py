@@ -1,29 +1,194 @@
-from django.db.models.signals import post_delete, post_save
-from django.dispatch import receiver
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver, Signal
 
-from main.models import Task, TaskDocument, Project, Block
-from utils.upload import task_delete_path
-from utils.other import find_type
-from constants import BLOCK_TYPES
+from main import cache, changelog, counters, events, search
+from authe.models import MainUser
+from main.models import Task, TaskDocument, TaskComment, Project, Block, touched
+from utils.upload import release_files
+from utils.other import type_display_name
+from constants import BLOCK_TYPES, CHANGE_CREATED, CHANGE_UPDATED, CHANGE_DELETED
+
+# Sent inside the transaction of a queryset.bulk_update(), which bypasses post_save.
+tasks_bulk_updated = Signal(providing_args=['tasks', 'block_ids', 'fields'])
 
 
 @receiver(post_delete, sender=TaskDocument)
 def task_deleted(sender, instance, **kwargs):
     if instance:
-        task_delete_path(document=instance.document)
+        release_files(instance.document, instance.thumbnail)
+
+
+@receiver(pre_save, sender=Project)
+def project_creating(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.blocks_count = len(BLOCK_TYPES)
 
 
 @receiver(post_save, sender=Project)
-def project_created(sender, instance, created=True, **kwargs):
-    for block_type in BLOCK_TYPES:
-        Block.objects.create(block_type=block_type[0], project=instance)
+def project_created(sender, instance, created, **kwargs):
+    # bulk_create skips the Block receivers; blocks_count is already set by project_creating.
+    if created:
+        blocks = Block.objects.bulk_create(
+            Block(name=type_display_name(BLOCK_TYPES, block_type), block_type=block_type, project=instance)
+            for block_type, _ in BLOCK_TYPES)
+        changelog.record_provisioned(instance, blocks)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    cache.invalidate('block', instance.block_id, getattr(instance, '_loaded_block_id', None))
+
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def block_changed(sender, instance, **kwargs):
+    cache.invalidate('block', instance.id)
+    cache.invalidate('project', instance.project_id)
+
+
+@receiver(post_save, sender=Project)
+def project_changed(sender, instance, **kwargs):
+    cache.invalidate('project', instance.id)
+
+
+@receiver(post_save, sender=MainUser)
+def username_changed(sender, instance, created, update_fields, **kwargs):
+    # Cached task lists show creator and executor usernames; the block versions feed their ETags.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    if getattr(instance, '_loaded_username', None) == instance.username:
+        return
+    instance._loaded_username = instance.username
+    block_ids = set(Task.objects.filter(Q(creator=instance) | Q(executor=instance)).values_list('block_id', flat=True))
+    if block_ids:
+        Block.objects.filter(id__in=block_ids).update(**touched())
+        cache.invalidate('block', *block_ids)
+
+
+@receiver(tasks_bulk_updated)
+def tasks_bulk_changed(sender, tasks, block_ids, fields, **kwargs):
+    cache.invalidate('block', *block_ids)
+    if 'block' in fields:
+        counters.reconcile_moves(block_ids)
+    changelog.record(CHANGE_UPDATED, *tasks)
+    events.publish(CHANGE_UPDATED, *tasks)
+
+
+@receiver(post_save, sender=Task)
+def task_counted(sender, instance, created, **kwargs):
+    if not counters.counters_active():
+        return
+    block = instance.block if Task.block.is_cached(instance) else None
+    if created:
+        counters.add_tasks(instance.block_id, 1, block)
+        return
+    loaded_block_id = getattr(instance, '_loaded_block_id', None)
+    if loaded_block_id is not None and loaded_block_id != instance.block_id:
+        counters.add_tasks(loaded_block_id, -1)
+        counters.add_tasks(instance.block_id, 1, block)
+
+
+@receiver(post_delete, sender=Task)
+def task_uncounted(sender, instance, **kwargs):
+    if counters.counters_active():
+        counters.add_tasks(instance.block_id, -1)
 
 
 @receiver(post_save, sender=Block)
-def block_created(sender, instance, created=True, **kwargs):
-    if (not instance.name) or instance.name == '':
-        if instance.block_type:
-            new_name = find_type(BLOCK_TYPES, instance.block_type).lower().replace('_', ' ')
-            new_name = f'{new_name[0].upper()}{new_name[1:]}'
-            instance.name = new_name
-            instance.save()
\ No newline at end of file
+def block_counted(sender, instance, created, **kwargs):
+    if not counters.counters_active():
+        return
+    if created:
+        counters.add_blocks(instance.project_id, 1)
+    elif getattr(instance, '_loaded_block_type', instance.block_type) != instance.block_type:
+        counters.reconcile({Project: [instance.project_id]}, counters={'Project.done_count'})
+        instance._loaded_block_type = instance.block_type
+
+
+@receiver(post_delete, sender=Block)
+def block_uncounted(sender, instance, **kwargs):
+    # The cascade deletes and uncounts the block's tasks first, so its loaded tasks_count is stale here.
+    if counters.counters_active():
+        counters.add_blocks(instance.project_id, -1)
+
+
+_CHILD_COUNTERS = {TaskComment: 'comments', TaskDocument: 'documents'}
+
+
+def _loaded_task(instance):
+    return instance.task if type(instance).task.is_cached(instance) else None
+
+
+@receiver(post_save, sender=TaskComment)
+@receiver(post_save, sender=TaskDocument)
+def task_child_counted(sender, instance, created, **kwargs):
+    if created and counters.counters_active():
+        counters.add_task_children(instance.task_id, **{_CHILD_COUNTERS[sender]: 1}, task=_loaded_task(instance))
+
+
+@receiver(post_delete, sender=TaskComment)
+@receiver(post_delete, sender=TaskDocument)
+def task_child_uncounted(sender, instance, **kwargs):
+    if counters.counters_active():
+        counters.add_task_children(instance.task_id, **{_CHILD_COUNTERS[sender]: -1}, task=_loaded_task(instance))
+
+
+_SEARCH_FIELDS = {'name', 'description'}
+
+
+@receiver(post_save, sender=Task)
+def task_indexed(sender, instance, created, update_fields=None, **kwargs):
+    # Moves and reorders save with update_fields and leave the indexed text alone.
+    if update_fields is not None and not _SEARCH_FIELDS.intersection(update_fields):
+        return
+    text = (instance.name, instance.description)
+    if created or getattr(instance, '_loaded_text', None) != text:
+        search.index(instance)
+        instance._loaded_text = text
+
+
+@receiver(post_save, sender=TaskComment)
+@receiver(post_save, sender=TaskDocument)
+def task_child_indexed(sender, instance, **kwargs):
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskComment)
+@receiver(post_delete, sender=TaskDocument)
+def search_entry_deleted(sender, instance, **kwargs):
+    search.remove(instance)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Block)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=TaskComment)
+@receiver(post_save, sender=TaskDocument)
+def change_logged(sender, instance, created, **kwargs):
+    changelog.record(CHANGE_CREATED if created else CHANGE_UPDATED, instance)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Block)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskComment)
+@receiver(post_delete, sender=TaskDocument)
+def tombstone_logged(sender, instance, **kwargs):
+    changelog.record(CHANGE_DELETED, instance)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=TaskComment)
+@receiver(post_save, sender=TaskDocument)
+def event_published(sender, instance, created, **kwargs):
+    events.publish(CHANGE_CREATED if created else CHANGE_UPDATED, instance)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskComment)
+@receiver(post_delete, sender=TaskDocument)
+def deletion_published(sender, instance, **kwargs):
+    events.publish(CHANGE_DELETED, instance)
@@ -1,3 +1,1128 @@
-from django.test import TestCase
+import asyncio
+import datetime as dt
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, router, transaction, IntegrityError
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from authe.authentication import access_token
+from authe.models import MainUser
+from constants import PROJECT_OPTIMIZATION, PROJECT_DEVELOPMENT, PROJECT_FROZEN, BLOCK_TODO, BLOCK_DONE, TASK_ORDER_GAP, \
+    CHANGE_DELETED, UPLOAD_PENDING, UPLOAD_FAILED
+from main import cache, counters, uploads
+from main.models import Project, Block, Task, TaskComment, TaskDocument, DocumentUpload, Blob, ChangeLogEntry, \
+    bulk_touch, touched
+from main.events import EventStreamApplication
+from main.permissions import owner_ids
+from main.signals import tasks_bulk_updated
+from utils import pubsub
+from utils.db import check_replica_pin_cache, set_replica_reads
+from utils.log import BackgroundQueueHandler, JSONFormatter
+from utils.metrics import store
+from utils.middleware import ReplicaRoutingMiddleware, PerformanceMiddleware
+
+
+class MainTestCase(APITestCase):
+    def setUp(self):
+        caches[cache.RESPONSE_CACHE].clear()
+        self.user = MainUser.objects.create_user(username='owner', password='password')
+        self.other = MainUser.objects.create_user(username='executor', password='password')
+        self.project = Project.objects.create(name='Board', creator=self.user, project_type=PROJECT_OPTIMIZATION)
+        self.block = Block.objects.filter(project=self.project, block_type=BLOCK_TODO).first()
+        self.client.force_authenticate(self.user)
+
+    def create_tasks(self, count, block=None):
+        return [Task.objects.create(name=f'Task {i}', priority=5, order=i, creator=self.user, executor=self.other,
+                                    block=block or self.block)
+                for i in range(count)]
+
+
+class QueryCountTests(MainTestCase):
+    def test_project_list(self):
+        for i in range(5):
+            Project.objects.create(name=f'Project {i}', creator=self.other, project_type=PROJECT_OPTIMIZATION)
+        with self.assertNumQueries(2):
+            response = self.client.get('/main/projects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][-1]['creator_name'], 'owner')
+
+    def test_block_tasks(self):
+        self.create_tasks(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/main/blocks/{self.block.id}/tasks/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['executor_name'], 'executor')
+
+    def test_project_tasks(self):
+        self.create_tasks(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/main/projects/{self.project.id}/tasks/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['block']['project_name'], 'Board')
+
+    def test_project_blocks(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/main/projects/{self.project.id}/blocks/')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_task_comments(self):
+        task = self.create_tasks(1)[0]
+        for i in range(10):
+            TaskComment.objects.create(body=f'Comment {i}', creator=self.other, task=task)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/main/tasks/{task.id}/comments/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['creator_name'], 'executor')
+
+    def test_task_documents(self):
+        task = self.create_tasks(1)[0]
+        for i in range(10):
+            TaskDocument.objects.create(document=f'doc{i}.docx', creator=self.other, task=task)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/main/tasks/{task.id}/documents/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['task_name'], 'Task 0')
+        document = response.data['results'][0]
+        self.assertEqual(document['document_full'], f"http://testserver/main/task_documents/{document['id']}/download/")
+
+    def test_my_tasks(self):
+        self.create_tasks(10)
+        with self.assertNumQueries(2):
+            response = self.client.get('/main/tasks/my/')
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class PaginationTests(MainTestCase):
+    def collect(self, url):
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.data['results'])
+            url = response.data['next']
+        return results
+
+    def test_block_tasks_cursor(self):
+        tasks = self.create_tasks(7)
+        tasks[0].order = 10
+        tasks[0].save()
+        results = self.collect(f'/main/blocks/{self.block.id}/tasks/?page_size=3')
+        self.assertEqual([item['id'] for item in results], [task.id for task in tasks[1:] + tasks[:1]])
+
+    def test_task_comments_cursor(self):
+        task = self.create_tasks(1)[0]
+        comments = [TaskComment.objects.create(body=f'Comment {i}', creator=self.user, task=task) for i in range(5)]
+        results = self.collect(f'/main/tasks/{task.id}/comments/?page_size=2')
+        self.assertEqual([item['id'] for item in results], [comment.id for comment in reversed(comments)])
+
+    def test_page_size(self):
+        self.create_tasks(5)
+        response = self.client.get('/main/tasks/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+
+class StreamingTests(MainTestCase):
+    def test_project_tasks_json_stream(self):
+        tasks = self.create_tasks(5)
+        response = self.client.get(f'/main/projects/{self.project.id}/tasks/?stream=json')
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([item['id'] for item in data], [task.id for task in tasks])
+        self.assertEqual(data[0]['block']['project_name'], 'Board')
+
+    def test_task_comments_ndjson_stream(self):
+        task = self.create_tasks(1)[0]
+        for i in range(3):
+            TaskComment.objects.create(body=f'Comment {i}', creator=self.user, task=task)
+        response = self.client.get(f'/main/tasks/{task.id}/comments/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['task_name'], 'Task 0')
+
+
+class ResponseCacheTests(MainTestCase):
+    def test_block_tasks_hit_and_invalidation(self):
+        task = self.create_tasks(3)[0]
+        url = f'/main/blocks/{self.block.id}/tasks/'
+        self.client.get(url)
+        hits = cache.cache_stats()['hits']
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(cache.cache_stats()['hits'], hits + 1)
+        self.assertEqual(len(response.data['results']), 3)
+
+        task.name = 'Renamed'
+        task.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_username_change_invalidates_task_lists(self):
+        self.create_tasks(1)
+        url = f'/main/blocks/{self.block.id}/tasks/'
+        etag = self.client.get(url)['ETag']
+        executor = MainUser.objects.get(id=self.other.id)
+        executor.last_name = 'Unchanged username'
+        executor.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        executor.username = 'assignee'
+        executor.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['results'][0]['executor_name']), (200, 'assignee'))
+
+    def test_counter_changes_invalidate_lists(self):
+        task = self.create_tasks(1)[0]
+        tasks_url = f'/main/blocks/{self.block.id}/tasks/'
+        blocks_url = f'/main/projects/{self.project.id}/blocks/'
+        self.assertEqual(self.client.get(tasks_url).data['results'][0]['comments_count'], 0)
+        self.assertEqual(sum(block['tasks_count'] for block in self.client.get(blocks_url).data['results']), 1)
+
+        TaskComment.objects.create(body='Counted', creator=self.user, task=task)
+        self.create_tasks(2)
+        self.assertEqual(self.client.get(tasks_url).data['results'][0]['comments_count'], 1)
+        self.assertEqual(sum(block['tasks_count'] for block in self.client.get(blocks_url).data['results']), 3)
+
+    def test_missed_invalidation_never_serves_stale_body(self):
+        task = self.create_tasks(1)[0]
+        url = f'/main/blocks/{self.block.id}/tasks/'
+        etag = self.client.get(url)['ETag']
+        # Written by another process: no signal reaches this process's cache.
+        Task.objects.filter(id=task.id).update(**touched(name='Elsewhere'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['name'], 'Elsewhere')
+
+    def test_task_move_invalidates_old_block(self):
+        task = self.create_tasks(1)[0]
+        url = f'/main/blocks/{self.block.id}/tasks/'
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+        task = Task.objects.get(id=task.id)
+        task.block = Block.objects.filter(project=self.project).exclude(id=self.block.id).first()
+        task.save()
+        self.assertEqual(len(self.client.get(url).data['results']), 0)
+
+    def test_project_blocks_invalidation(self):
+        url = f'/main/projects/{self.project.id}/blocks/'
+        self.assertEqual(len(self.client.get(url).data['results']), 4)
+        Block.objects.create(name='Review', block_type=BLOCK_TODO, project=self.project)
+        self.assertEqual(len(self.client.get(url).data['results']), 5)
+
+
+class BulkTaskUpdateTests(MainTestCase):
+    def test_bulk_move(self):
+        tasks = self.create_tasks(20)
+        done = Block.objects.filter(project=self.project).exclude(id=self.block.id).first()
+        changes = [{'id': task.id, 'order': 100 - i, 'block': done.id} for i, task in enumerate(tasks[:10])]
+        changes.append({'id': tasks[10].id, 'priority': 9, 'executor': None})
+        with self.assertNumQueries(13):
+            response = self.client.patch('/main/tasks/bulk/', changes, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['blocks'][done.id], [task.id for task in reversed(tasks[:10])])
+        self.assertEqual(response.data['blocks'][self.block.id], [task.id for task in tasks[10:]])
+        task = Task.objects.get(id=tasks[10].id)
+        self.assertEqual((task.priority, task.executor_id), (9, None))
+
+    def test_bulk_permission(self):
+        task = self.create_tasks(1)[0]
+        self.client.force_authenticate(self.other)
+        response = self.client.patch('/main/tasks/bulk/', [{'id': task.id, 'order': 5}], format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Task.objects.get(id=task.id).order, 0)
+
+    def test_bulk_rejects_repeated_tasks(self):
+        task = self.create_tasks(1)[0]
+        response = self.client.patch('/main/tasks/bulk/', [{'id': task.id, 'order': 5}, {'id': task.id, 'order': 7}],
+                                     format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(task.id), response.data[0])
+        self.assertEqual(Task.objects.get(id=task.id).order, 0)
+
+    def test_bulk_rejects_foreign_block(self):
+        task = self.create_tasks(1)[0]
+        other_project = Project.objects.create(name='Other', creator=self.user, project_type=PROJECT_OPTIMIZATION)
+        response = self.client.patch('/main/tasks/bulk/',
+                                     [{'id': task.id, 'block': other_project.blocks.first().id}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskOrderingTests(MainTestCase):
+    def ordered_ids(self, block=None):
+        return list(Task.objects.in_block(block or self.block).values_list('id', flat=True))
+
+    def test_create_appends_with_gap(self):
+        for name in ('First', 'Second'):
+            response = self.client.post(f'/main/blocks/{self.block.id}/tasks/', {'name': name, 'priority': 3})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Task.objects.in_block(self.block).values_list('order', flat=True)),
+                         [TASK_ORDER_GAP, 2 * TASK_ORDER_GAP])
+
+    def test_move_between_neighbours_touches_one_row(self):
+        first, second, third = [Task.objects.create(name=name, priority=5, order=Task.objects.next_order(self.block),
+                                                    creator=self.user, block=self.block)
+                                for name in ('first', 'second', 'third')]
+        response = self.client.post(f'/main/tasks/{third.id}/move/', {'block': self.block.id, 'after': first.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ordered_ids(), [first.id, third.id, second.id])
+        self.assertEqual(Task.objects.get(id=second.id).order, 2 * TASK_ORDER_GAP)
+
+        response = self.client.post(f'/main/tasks/{second.id}/move/', {'block': self.block.id})
+        self.assertEqual(self.ordered_ids(), [second.id, first.id, third.id])
+
+    def test_move_rebalances_when_gap_runs_out(self):
+        first = Task.objects.create(name='first', priority=5, order=1, creator=self.user, block=self.block)
+        second = Task.objects.create(name='second', priority=5, order=2, creator=self.user, block=self.block)
+        moved = Task.objects.create(name='moved', priority=5, order=3, creator=self.user, block=self.block)
+        Task.objects.place(moved, self.block, first)
+        self.assertEqual(self.ordered_ids(), [first.id, moved.id, second.id])
+        self.assertEqual(Task.objects.get(id=second.id).order, 2 * TASK_ORDER_GAP)
+
+    def test_move_behind_a_tied_sibling(self):
+        first, second, third, moved = [Task.objects.create(name=name, priority=5, order=TASK_ORDER_GAP,
+                                                           creator=self.user, block=self.block)
+                                       for name in ('first', 'second', 'third', 'moved')]
+        Task.objects.place(moved, self.block, first)
+        self.assertEqual(self.ordered_ids(), [first.id, moved.id, second.id, third.id])
+
+    def test_rebalance(self):
+        tasks = self.create_tasks(4)
+        with self.assertNumQueries(6):
+            self.assertEqual(Task.objects.rebalance(self.block.id), 4)
+        self.assertEqual(self.ordered_ids(), [task.id for task in tasks])
+        self.assertEqual(Task.objects.rebalance(self.block.id), 0)
+
+    def test_bulk_touch_bumps_stored_versions(self):
+        tasks = self.create_tasks(2)
+        # Written elsewhere after these instances were loaded.
+        Task.objects.filter(id=tasks[0].id).update(**touched())
+        for task in tasks:
+            task.order += TASK_ORDER_GAP
+        with transaction.atomic():
+            bulk_touch(tasks, ['order'])
+        stored = dict(Task.objects.values_list('id', 'version'))
+        self.assertEqual([task.version for task in tasks], [3, 2])
+        self.assertEqual([stored[task.id] for task in tasks], [3, 2])
+
+
+class CounterTests(MainTestCase):
+    def assertCounts(self, obj, **expected):
+        obj.refresh_from_db()
+        self.assertEqual({field: getattr(obj, field) for field in expected}, expected)
+
+    def test_task_lifecycle(self):
+        done = Block.objects.get(project=self.project, block_type=BLOCK_DONE)
+        task, other = self.create_tasks(2)
+        self.assertCounts(self.block, tasks_count=2)
+        self.assertCounts(self.project, blocks_count=4, tasks_count=2, done_count=0)
+
+        task.block = done
+        task.save()
+        self.assertCounts(self.block, tasks_count=1)
+        self.assertCounts(done, tasks_count=1)
+        self.assertCounts(self.project, tasks_count=2, done_count=1)
+
+        task.delete()
+        self.assertCounts(done, tasks_count=0)
+        self.assertCounts(self.project, tasks_count=1, done_count=0)
+
+    def test_comments_and_documents(self):
+        task = self.create_tasks(1)[0]
+        comment = TaskComment.objects.create(body='Comment', creator=self.user, task=task)
+        TaskComment.objects.create(body='Comment', creator=self.user, task=task)
+        TaskDocument.objects.create(document='spec.docx', creator=self.user, task=task)
+        self.assertCounts(task, comments_count=2, documents_count=1)
+        comment.delete()
+        self.assertCounts(task, comments_count=1, documents_count=1)
+        self.assertEqual(Task.objects.documents_gte_comments().count(), 1)
+
+    def test_full_save_keeps_counters(self):
+        task = self.create_tasks(1)[0]
+        TaskComment.objects.create(body='Comment', creator=self.user, task=task)
+        task.name = 'Renamed'
+        task.save()
+        self.project.save()
+        self.assertCounts(task, comments_count=1)
+        self.assertCounts(self.project, tasks_count=1)
+
+    def test_block_delete_cascade(self):
+        self.create_tasks(3)
+        with self.assertNumQueries(15):
+            self.block.delete()
+        self.assertCounts(self.project, blocks_count=3, tasks_count=0, done_count=0)
+
+    def test_queryset_block_delete_cascade(self):
+        self.create_tasks(3)
+        Block.objects.filter(id=self.block.id).delete()
+        self.assertCounts(self.project, blocks_count=3, tasks_count=0, done_count=0)
+
+    def test_bulk_move_and_reconcile(self):
+        done = Block.objects.get(project=self.project, block_type=BLOCK_DONE)
+        tasks = self.create_tasks(3)
+        self.client.patch('/main/tasks/bulk/', [{'id': task.id, 'block': done.id} for task in tasks[:2]],
+                          format='json')
+        self.assertCounts(done, tasks_count=2)
+        self.assertCounts(self.project, tasks_count=3, done_count=2)
+
+        Block.objects.filter(id=done.id).update(tasks_count=0)
+        self.assertEqual(counters.reconcile()['Block.tasks_count'], 1)
+        self.assertCounts(done, tasks_count=2)
+        self.assertEqual(set(counters.reconcile().values()), {0})
+
+
+class PermissionTests(MainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task = self.create_tasks(1)[0]
+        self.comment = TaskComment.objects.create(body='Comment', creator=self.other, task=self.task)
+
+    def test_owner_ids_single_query_and_memoized(self):
+        request = RequestFactory().get('/')
+        comment = TaskComment.objects.get(id=self.comment.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(owner_ids(request, comment), {self.user.id, self.other.id})
+            self.assertEqual(owner_ids(request, comment), {self.user.id, self.other.id})
+
+    def test_owner_ids_from_loaded_relations(self):
+        comment = TaskComment.objects.select_related('task__block__project').get(id=self.comment.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(owner_ids(RequestFactory().get('/'), comment), {self.user.id, self.other.id})
+
+    def test_task_update_denied_for_stranger(self):
+        stranger = MainUser.objects.create_user(username='stranger', password='password')
+        self.client.force_authenticate(stranger)
+        response = self.client.patch(f'/main/tasks/{self.task.id}/', {'name': 'Hijacked'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.delete(f'/main/task_comments/{self.comment.id}/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_comment_delete_by_project_owner(self):
+        with self.assertNumQueries(5):
+            response = self.client.delete(f'/main/task_comments/{self.comment.id}/')
+        self.assertEqual(response.status_code, 204)
+
+
+class ProjectFilterTests(MainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.development = Project.objects.create(name='Dev', creator=self.other, project_type=PROJECT_DEVELOPMENT,
+                                                  status=PROJECT_FROZEN)
+
+    def test_queryset_chaining(self):
+        self.assertEqual(list(Project.objects.development_projects()), [self.development])
+        self.assertEqual(list(Project.objects.filter_by_creator(self.other).frozen_projects()), [self.development])
+        self.assertFalse(Project.objects.development_projects().filter_by_creator(self.user).exists())
+        self.assertEqual(Project.objects.count(), 2)
+
+    def test_list_filters(self):
+        response = self.client.get(f'/main/projects/?type={PROJECT_DEVELOPMENT}&status={PROJECT_FROZEN}')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.development.id])
+        response = self.client.get(f'/main/projects/?creator={self.user.id}')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.project.id])
+
+    def test_invalid_filter(self):
+        response = self.client.get('/main/projects/?status=9')
+        self.assertEqual(response.status_code, 400)
+
+
+class CommentWindowTests(MainTestCase):
+    def test_windows_across_year_boundary(self):
+        task = self.create_tasks(1)[0]
+        now = timezone.make_aware(dt.datetime(2020, 1, 10, 12))
+        for days in (1, 20, 40):
+            comment = TaskComment.objects.create(body=f'{days} days ago', creator=self.user, task=task)
+            TaskComment.objects.filter(id=comment.id).update(created_at=now - dt.timedelta(days=days))
+        comments = TaskComment.objects.filter(task=task)
+        self.assertEqual(comments.last_days(30, now=now).count(), 2)
+        self.assertEqual(comments.last_days(7, now=now).count(), 1)
+        self.assertEqual(comments.between(now - dt.timedelta(days=45), now - dt.timedelta(days=10)).count(), 2)
+        self.assertEqual(comments.since(now - dt.timedelta(days=2)).count(), 1)
+
+
+class ProjectProvisioningTests(MainTestCase):
+    def test_create_provisions_and_logs_blocks_in_bulk(self):
+        with self.assertNumQueries(4):
+            project = Project.objects.create(name='New', creator=self.user)
+        self.assertEqual(list(project.blocks.order_by('block_type').values_list('name', flat=True)),
+                         ['Backlog', 'Todo', 'In process', 'Done'])
+        self.assertEqual(Project.objects.get(id=project.id).blocks_count, 4)
+
+    def test_update_does_not_add_blocks(self):
+        self.project.name = 'Renamed'
+        self.project.save()
+        self.assertEqual(self.project.blocks.count(), 4)
+
+    def test_create_endpoint(self):
+        response = self.client.post('/main/projects/', {'name': 'Api', 'status': 2, 'project_type': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Block.objects.filter(project_id=response.data['id']).count(), 4)
+
+
+class MediaTestCase(MainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              UPLOAD_CHUNK_ROOT=f'{self.media_root}/uploads')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ChunkedUploadTests(MediaTestCase):
+    def put_chunk(self, upload_id, data, start, total):
+        return self.client.put(f'/main/document_uploads/{upload_id}/chunk/', data,
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{total}')
+
+    def test_resumable_upload(self):
+        task = self.create_tasks(1)[0]
+        content = b'x' * 1000 + b'y' * 500
+        response = self.client.post('/main/document_uploads/',
+                                    {'task': task.id, 'filename': 'spec.docx', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['id']
+
+        self.assertEqual(self.put_chunk(upload_id, content[:1000], 0, len(content)).data['received'], 1000)
+        response = self.put_chunk(upload_id, content[:10], 0, len(content))
+        self.assertEqual((response.status_code, response.data['received']), (409, 1000))
+        self.assertEqual(self.client.get(f'/main/document_uploads/{upload_id}/').data['received'], 1000)
+        self.put_chunk(upload_id, content[1000:], 1000, len(content))
+
+        response = self.client.post(f'/main/document_uploads/{upload_id}/complete/')
+        self.assertEqual((response.status_code, response.data['status_name']), (202, 'PROCESSING'))
+        uploads.finalize_upload(upload_id)
+
+        upload = DocumentUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.document.checksum, hashlib.sha256(content).hexdigest())
+        with upload.document.document.open('rb') as document:
+            self.assertEqual(document.read(), content)
+        self.assertEqual(Task.objects.get(id=task.id).documents_count, 1)
+
+    def test_concurrent_chunk_at_same_offset_conflicts(self):
+        task = self.create_tasks(1)[0]
+        response = self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'a.docx', 'size': 8})
+        first, second = [DocumentUpload.objects.get(id=response.data['id']) for _ in range(2)]
+        uploads.append_chunk(first, io.BytesIO(b'1234'), 0, 4)
+        with self.assertRaises(DjangoValidationError):
+            uploads.append_chunk(second, io.BytesIO(b'abcd'), 0, 4)
+        self.assertEqual((second.received, DocumentUpload.objects.get(id=second.id).received), (4, 4))
+        with open(first.part_path, 'rb') as part:
+            self.assertEqual(part.read(), b'1234')
+
+    def test_short_chunk_releases_its_offset(self):
+        task = self.create_tasks(1)[0]
+        response = self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'a.docx', 'size': 8})
+        upload = DocumentUpload.objects.get(id=response.data['id'])
+        with self.assertRaises(DjangoValidationError):
+            uploads.append_chunk(upload, io.BytesIO(b'12'), 0, 4)
+        self.assertEqual((upload.received, DocumentUpload.objects.get(id=upload.id).received), (0, 0))
+        uploads.append_chunk(upload, io.BytesIO(b'1234'), 0, 4)
+        self.assertEqual(DocumentUpload.objects.get(id=upload.id).received, 4)
+
+    def test_purge_expired_uploads(self):
+        task = self.create_tasks(1)[0]
+        idle, active, empty = [self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'a.docx',
+                                                                          'size': 8}).data['id']
+                               for _ in range(3)]
+        for upload_id in (idle, active):
+            self.put_chunk(upload_id, b'1234', 0, 8)
+        orphan = f'{settings.UPLOAD_CHUNK_ROOT}/{uuid.uuid4()}.part'
+        open(orphan, 'wb').close()
+        old = time.time() - 25 * 3600
+        for path in (DocumentUpload.objects.get(id=idle).part_path, orphan):
+            os.utime(path, (old, old))
+        DocumentUpload.objects.filter(id=empty).update(created_at=timezone.now() - dt.timedelta(hours=25))
+
+        out = io.StringIO()
+        call_command('purge_uploads', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '2 uploads expired and 2 part files removed')
+        statuses = dict(DocumentUpload.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[uuid.UUID(upload_id)] for upload_id in (idle, active, empty)],
+                         [UPLOAD_FAILED, UPLOAD_PENDING, UPLOAD_FAILED])
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(DocumentUpload.objects.get(id=active).part_path))
+
+    def test_rejects_invalid_uploads(self):
+        task = self.create_tasks(1)[0]
+        response = self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'run.exe', 'size': 10})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/main/document_uploads/',
+                                    {'task': task.id, 'filename': 'big.png', 'size': 6000000})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'a.png', 'size': 4})
+        self.assertEqual(self.put_chunk(response.data['id'], b'123456', 0, 4).status_code, 409)
+
+    def test_requires_task_permission(self):
+        task = self.create_tasks(1)[0]
+        self.client.force_authenticate(MainUser.objects.create_user(username='stranger', password='password'))
+        response = self.client.post('/main/document_uploads/', {'task': task.id, 'filename': 'a.png', 'size': 4})
+        self.assertEqual(response.status_code, 403)
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def create_document(self, task, content, name='spec.docx'):
+        return TaskDocument.objects.create(document=ContentFile(content, name=name), creator=self.user, task=task)
+
+    def commit(self):
+        """Runs the on_commit callbacks the test case's transaction holds back."""
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for savepoint_ids, callback in callbacks:
+            callback()
+
+    def test_duplicates_share_one_blob(self):
+        first, second = self.create_tasks(2)
+        documents = [self.create_document(first, b'spec'), self.create_document(second, b'spec', 'copy.docx')]
+        other = self.create_document(second, b'other spec')
+        name = documents[0].document.name
+
+        self.assertEqual(documents[1].document.name, name)
+        self.assertNotEqual(other.document.name, name)
+        self.assertEqual([document.filename for document in documents], ['spec.docx', 'copy.docx'])
+        self.assertEqual(Blob.objects.get(name=name).refs, 2)
+
+        documents[0].delete()
+        self.commit()
+        self.assertTrue(default_storage.exists(name))
+        first.delete()
+        second.delete()
+        self.commit()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(other.document.name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_replaced_avatar_is_released(self):
+        profile = self.user.profile
+        profile.avatar.save('me.png', ContentFile(b'old avatar'))
+        old_name = profile.avatar.name
+        self.create_document(self.create_tasks(1)[0], b'old avatar', 'shared.png')
+
+        profile = type(profile).objects.get(id=profile.id)
+        profile.avatar.save('me.png', ContentFile(b'new avatar'))
+        self.assertEqual(Blob.objects.get(name=old_name).refs, 1)
+        TaskDocument.objects.get().delete()
+        self.commit()
+        self.assertFalse(default_storage.exists(old_name))
+
+        new_name = profile.avatar.name
+        profile.avatar.save('again.png', ContentFile(b'new avatar'))
+        self.assertEqual((profile.avatar.name, Blob.objects.get(name=new_name).refs), (new_name, 1))
+        self.user.delete()
+        self.commit()
+        self.assertFalse(default_storage.exists(new_name))
+
+    def test_rolled_back_delete_keeps_file(self):
+        document = self.create_document(self.create_tasks(1)[0], b'spec')
+        name = document.document.name
+        try:
+            with transaction.atomic():
+                document.delete()
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.commit()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refs, 1)
+
+
+class DocumentDownloadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.document = TaskDocument.objects.create(document=ContentFile(b'0123456789', name='spec.docx'),
+                                                    creator=self.user, task=self.create_tasks(1)[0])
+        self.url = f'/main/task_documents/{self.document.id}/download/'
+
+    def download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_full_download_and_etag(self):
+        with self.assertNumQueries(1):
+            response = self.download(HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual((response.status_code, response.body), (200, b'0123456789'))
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(b"0123456789").hexdigest()}"')
+        self.assertIn('spec.docx', response['Content-Disposition'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.download(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        response = self.download(HTTP_RANGE='bytes=2-5')
+        self.assertEqual((response.status_code, response.body), (206, b'2345'))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 2-5/10', '4'))
+        self.assertEqual(self.download(HTTP_RANGE='bytes=-3').body, b'789')
+        self.assertEqual(self.download(HTTP_RANGE='bytes=7-').body, b'789')
+        self.assertEqual(self.download(HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertEqual(self.download(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_sendfile_offload(self):
+        with override_settings(DOCUMENT_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.download()
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.document.document.name}')
+
+    def test_filenames_are_escaped(self):
+        TaskDocument.objects.filter(id=self.document.id).update(filename='plan "v2".docx')
+        self.assertEqual(self.download()['Content-Disposition'], 'attachment; filename="plan \\"v2\\".docx"')
+        TaskDocument.objects.filter(id=self.document.id).update(filename='план.docx')
+        with override_settings(DOCUMENT_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.download()
+        self.assertEqual(response['Content-Disposition'],
+                         "attachment; filename*=utf-8''%D0%BF%D0%BB%D0%B0%D0%BD.docx")
+
+    def test_missing_file_is_not_found(self):
+        os.remove(self.document.document.path)
+        self.assertEqual(self.download().status_code, 404)
+
+    def test_requires_permission(self):
+        self.client.force_authenticate(MainUser.objects.create_user(username='stranger', password='password'))
+        self.assertEqual(self.download().status_code, 403)
+
+
+class DatabaseSettingsTests(APITestCase):
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routed = []
+        self.middleware = ReplicaRoutingMiddleware(self.view)
+
+    def view(self, request):
+        self.routed.append((router.db_for_read(Task), router.db_for_write(Task)))
+        return HttpResponse()
+
+    def get(self, path, user=None):
+        auth = {'HTTP_AUTHORIZATION': f'JWT {access_token(user)}'} if user is not None else {}
+        return self.factory.get(path, **auth)
+
+    def test_reads_go_to_replicas_until_the_user_writes(self):
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        user, other = MainUser(id=1, username='owner'), MainUser(id=2, username='executor')
+        self.middleware(self.get('/main/tasks/', user))
+        write = self.factory.post('/main/tasks/', HTTP_AUTHORIZATION=f'JWT {access_token(user)}')
+        self.middleware(write)
+        self.middleware(self.get('/main/tasks/', user))
+        self.middleware(self.get('/main/tasks/', other))
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        self.middleware(self.get('/main/tasks/', user))
+
+        self.assertEqual(self.routed, [('replica1', 'default'), ('default', 'default'), ('default', 'default'),
+                                       ('replica1', 'default'), ('replica1', 'default')])
+        self.assertEqual(router.db_for_read(Task), 'default')
+
+    def test_cache_misses_are_built_from_the_primary(self):
+        def build():
+            self.routed.append(router.db_for_read(Task))
+            return {}
+
+        caches[cache.RESPONSE_CACHE].clear()
+        set_replica_reads(True)
+        try:
+            cache.cached_data('block', 1, self.factory.get('/main/blocks/1/tasks/'), build)
+            self.assertEqual(router.db_for_read(Task), 'replica1')
+        finally:
+            set_replica_reads(False)
+        self.assertEqual(self.routed, ['default'])
+
+    def test_pin_cache_must_be_shared(self):
+        self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['utils.E001'])
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}
+        with override_settings(CACHES={'default': shared}):
+            self.assertEqual(check_replica_pin_cache(None), [])
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertEqual(check_replica_pin_cache(None), [])
+
+
+class PerformanceMiddlewareTests(MainTestCase):
+    def setUp(self):
+        super().setUp()
+        store.clear()
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=True)
+    def test_records_requests(self):
+        self.create_tasks(2)
+        with self.assertLogs('metrics') as logs:
+            response = self.client.get(f'/main/blocks/{self.block.id}/tasks/')
+        record = logs.records[0]
+        self.assertEqual((record.view, record.status, record.size), ('BlockViewSet.tasks', 200, len(response.content)))
+        self.assertGreater(record.queries, 0)
+        self.assertFalse(hasattr(record, 'duplicate_queries'))
+        self.assertGreater(record.serialize_ms, 0)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        self.assertEqual(store.snapshot()['BlockViewSet.tasks']['count'], 1)
+
+    def test_records_streamed_responses_when_they_close(self):
+        self.create_tasks(3)
+        with self.assertLogs('metrics') as logs:
+            response = self.client.get(f'/main/projects/{self.project.id}/tasks/?stream=json')
+            self.assertEqual(logs.records, [])
+            body = b''.join(response.streaming_content)
+            response.close()
+        record = logs.records[0]
+        self.assertEqual((record.view, record.size), ('ProjectViewSet.tasks', len(body)))
+        self.assertGreater(record.serialize_ms, 0)
+        self.assertGreater(record.queries, 0)
+
+    def test_file_responses_keep_their_file_wrapper(self):
+        def view(request):
+            return FileResponse(io.BytesIO(b'attachment'), filename='notes.txt')
+
+        with self.assertLogs('metrics') as logs:
+            response = PerformanceMiddleware(view)(RequestFactory().get('/'))
+            self.assertIsNotNone(response.file_to_stream)
+            self.assertEqual(logs.records, [])
+            response.close()
+        self.assertEqual(logs.records[0].size, len(b'attachment'))
+
+    def test_flags_repeated_queries(self):
+        def view(request):
+            for task_id in range(3):
+                Task.objects.filter(id=task_id).first()
+            return HttpResponse()
+
+        with self.assertLogs('metrics') as logs:
+            PerformanceMiddleware(view)(RequestFactory().get('/'))
+        duplicates = logs.records[0].duplicate_queries
+        self.assertEqual(duplicates[0]['count'], 3)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/main/metrics/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(f'/main/projects/{self.project.id}/blocks/')
+        response = self.client.get('/main/metrics/')
+        self.assertEqual(response.data['requests']['ProjectViewSet.blocks']['count'], 1)
+        self.assertIn('hit_ratio', response.data['response_cache'])
+
+
+class LoggingTests(SimpleTestCase):
+    def test_queue_handler_writes_json_in_the_background(self):
+        lines = []
+        target = logging.Handler()
+        target.setFormatter(JSONFormatter())
+        target.emit = lambda record: lines.append(target.format(record))
+        handler = BackgroundQueueHandler([target])
+        logger = logging.getLogger('tests.queue')
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.info('%s moved task %s', 'owner', 7, extra={'block': 3})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('failed')
+        handler.close()
+
+        first, second = map(json.loads, lines)
+        self.assertEqual((first['message'], first['block'], first['level']), ('owner moved task 7', 3, 'INFO'))
+        self.assertIn('ValueError: boom', second['exc_info'])
+
+
+class SearchTests(MainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.create(name='Deploy pipeline', description='Kubernetes rollout', priority=5,
+                                        order=1, creator=self.user, block=self.block)
+        self.comment = TaskComment.objects.create(body='Rollback plan is ready', creator=self.other, task=self.task)
+        TaskDocument.objects.create(document='TaskDocuments/rollout-spec.docx', creator=self.user, task=self.task)
+
+    def search(self, **params):
+        return self.client.get('/main/search/', params).data
+
+    def test_ranked_hits_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.search(q='roll')
+        self.assertEqual(sorted(hit['type'] for hit in data['results']), ['comment', 'document', 'task'])
+        self.assertEqual({hit['project'] for hit in data['results']}, {self.project.id})
+        self.assertEqual([hit['id'] for hit in self.search(q='kubernetes rollout')['results']], [self.task.id])
+        self.assertEqual(self.search(q='roll', type='comment')['results'][0]['title'], 'Rollback plan is ready')
+        self.assertEqual(self.search(q='"*')['results'], [])
+
+    def test_pagination(self):
+        first = self.search(q='roll', limit=2)
+        self.assertEqual(len(first['results']), 2)
+        second = self.client.get(first['next']).data
+        self.assertEqual((len(second['results']), second['next']), (1, None))
+
+    def test_index_follows_changes(self):
+        self.task.name = 'Release train'
+        self.task.save()
+        self.comment.delete()
+        self.assertEqual([hit['type'] for hit in self.search(q='release')['results']], ['task'])
+        self.assertEqual(self.search(q='deploy')['results'], [])
+        self.assertEqual(self.search(q='rollback')['results'], [])
+
+    def test_only_own_tasks(self):
+        self.client.force_authenticate(MainUser.objects.create_user(username='stranger', password='password'))
+        self.assertEqual(self.search(q='roll')['results'], [])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.search(q='roll')['results']), 3)
+
+
+class BoardTests(MainTestCase):
+    def test_board_snapshot(self):
+        done = Block.objects.get(project=self.project, block_type=BLOCK_DONE)
+        tasks = self.create_tasks(3)
+        Task.objects.create(name='Shipped', priority=1, order=1, creator=self.user, block=done)
+        TaskComment.objects.create(body='Comment', creator=self.user, task=tasks[2])
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/main/projects/{self.project.id}/board/')
+        data = response.data
+        self.assertEqual((data['tasks_count'], data['creator_name'], len(data['blocks'])), (4, 'owner', 4))
+        blocks = {block['block_type']: block for block in data['blocks']}
+        todo_tasks = blocks[BLOCK_TODO]['tasks']
+        self.assertEqual([task['id'] for task in todo_tasks], [task.id for task in tasks])
+        self.assertEqual((todo_tasks[0]['executor_name'], todo_tasks[2]['comments_count']), ('executor', 1))
+        self.assertEqual(blocks[BLOCK_DONE]['tasks'][0]['executor_name'], None)
+
+    def test_etag(self):
+        task = self.create_tasks(1)[0]
+        url = f'/main/projects/{self.project.id}/board/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        task.name = 'Renamed'
+        task.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ConditionalGetTests(MainTestCase):
+    def assertNotModified(self, url, response, queries):
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def assertModified(self, url, response):
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+        return fresh
+
+    def test_collections(self):
+        task = self.create_tasks(2)[0]
+        url = f'/main/blocks/{self.block.id}/tasks/'
+        response = self.client.get(url)
+        self.assertNotModified(url, response, 3)
+        task.priority = 9
+        task.save(update_fields=['priority'])
+        response = self.assertModified(url, response)
+        task.delete()
+        response = self.assertModified(url, response)
+
+        task = self.create_tasks(1)[0]
+        url = f'/main/tasks/{task.id}/comments/'
+        response = self.client.get(url)
+        self.assertNotModified(url, response, 2)
+        self.assertNotIn('Last-Modified', response)
+        TaskComment.objects.create(body='New', creator=self.user, task=task)
+        self.assertModified(url, response)
+
+    def test_details(self):
+        task = self.create_tasks(1)[0]
+        url = f'/main/tasks/{task.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertNotModified(url, response, 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        # The task embeds its block, so a block rename is a change too.
+        self.block.name = 'Next up'
+        self.block.save()
+        response = self.assertModified(url, response)
+        TaskComment.objects.create(body='Counted', creator=self.user, task=task)
+        self.assertModified(url, response)
+
+    def test_bulk_updates_and_counters_move_validators(self):
+        tasks = self.create_tasks(2)
+        url = f'/main/projects/{self.project.id}/board/'
+        response = self.client.get(url)
+        self.assertNotModified(url, response, 3)
+        self.client.patch('/main/tasks/bulk/', [{'id': tasks[0].id, 'priority': 1}], format='json')
+        response = self.assertModified(url, response)
+        Task.objects.rebalance(self.block.id)
+        self.assertEqual(Task.objects.get(id=tasks[0].id).version, 3)
+        # A full save of a copy loaded before those F() bumps still moves the version forward.
+        tasks[0].save()
+        self.assertEqual((tasks[0].version, Task.objects.get(id=tasks[0].id).version), (4, 4))
+
+        url = '/main/projects/'
+        response = self.client.get(url)
+        self.assertNotModified(url, response, 1)
+        tasks[1].delete()
+        self.assertModified(url, response)
+
+
+class ChangeFeedTests(MainTestCase):
+    def changes(self, since=0, **params):
+        return self.client.get(f'/main/projects/{self.project.id}/changes/', {'since': since, **params})
+
+    def test_feed_since_cursor(self):
+        cursor = self.changes().data['cursor']
+        task = self.create_tasks(1)[0]
+        task.name = 'Renamed'
+        task.save()
+        comment = TaskComment.objects.create(body='Comment', creator=self.user, task=task)
+        comment.delete()
+        with self.assertNumQueries(4):
+            data = self.changes(cursor).data
+        self.assertFalse(data['has_more'])
+        changes = [(change['type'], change['action']) for change in data['changes']]
+        # The task's create and update fold into one change carrying the current row.
+        self.assertEqual(changes, [('task', 'updated'), ('comment', 'deleted')])
+        self.assertEqual((data['changes'][0]['data']['name'], data['changes'][0]['version']), ('Renamed', 2))
+        self.assertNotIn('comments_count', data['changes'][0]['data'])
+        self.assertIsNone(data['changes'][1]['data'])
+        self.assertEqual(self.changes(data['cursor']).data['changes'], [])
+
+    def test_pages_and_bulk_writes(self):
+        data = self.changes(limit=4).data
+        self.assertEqual([change['type'] for change in data['changes']], ['block'] * 4)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(self.changes(data['cursor']).data['changes'][0]['id'], self.project.id)
+        tasks = self.create_tasks(2)
+        cursor = ChangeLogEntry.objects.latest('id').id
+        self.client.patch('/main/tasks/bulk/', [{'id': task.id, 'priority': 9} for task in tasks], format='json')
+        data = self.changes(cursor).data
+        self.assertEqual([(change['id'], change['data']['priority']) for change in data['changes']],
+                         [(task.id, 9) for task in tasks])
+
+    def test_bulk_write_rolls_back_with_its_entries(self):
+        task = self.create_tasks(1)[0]
+
+        def fail(**kwargs):
+            raise RuntimeError
+
+        tasks_bulk_updated.connect(fail)
+        try:
+            with self.assertRaises(RuntimeError):
+                self.client.patch('/main/tasks/bulk/', [{'id': task.id, 'priority': 9}], format='json')
+        finally:
+            tasks_bulk_updated.disconnect(fail)
+        self.assertEqual(Task.objects.get(id=task.id).priority, task.priority)
+
+    def test_project_delete_writes_one_tombstone(self):
+        self.create_tasks(2)
+        project_id = self.project.id
+        self.project.delete()
+        self.assertEqual(list(ChangeLogEntry.objects.filter(project_id=project_id, action=CHANGE_DELETED)
+                              .values_list('object_type', flat=True)), ['project'])
+
+    def test_compaction(self):
+        task = self.create_tasks(2)[0]
+        cursor = self.changes().data['cursor']
+        task.save()
+        task_id = task.id
+        task.delete()
+        call_command('compact_change_log', stdout=io.StringIO())
+        self.assertEqual(ChangeLogEntry.objects.filter(object_type='task', object_id=task_id).count(), 1)
+        self.assertEqual(self.changes(cursor).status_code, 200)
+
+        ChangeLogEntry.objects.filter(action=CHANGE_DELETED).update(created_at=timezone.now() - dt.timedelta(days=31))
+        out = io.StringIO()
+        call_command('compact_change_log', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '0 superseded entries and 1 tombstones deleted')
+        self.assertEqual(self.changes(cursor).status_code, 410)
+        self.assertEqual(self.changes().status_code, 200)
+
+
+class EventStreamTests(APITransactionTestCase):
+    def setUp(self):
+        pubsub.stats.clear()
+        self.user = MainUser.objects.create_user(username='owner', password='password')
+        self.project = Project.objects.create(name='Board', creator=self.user)
+        self.block = Block.objects.get(project=self.project, block_type=BLOCK_TODO)
+        self.url = f'/main/projects/{self.project.id}/events/'
+        self.passed = []
+        self.application = EventStreamApplication(self.django_application)
+
+    async def django_application(self, scope, receive, send):
+        self.passed.append(scope['path'])
+
+    def scope(self, path, token=None):
+        headers = [(b'authorization', f'JWT {token}'.encode())] if token else []
+        return {'type': 'http', 'method': 'GET', 'path': path, 'headers': headers, 'query_string': b''}
+
+    async def status(self, scope):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await self.application(scope, None, send)
+        return sent[0]['status'] if sent else None
+
+    def test_routing_and_auth(self):
+        async def scenario():
+            return [await self.status(self.scope('/main/projects/')),
+                    await self.status(self.scope(self.url)),
+                    await self.status(self.scope(self.url, 'not.a.token')),
+                    await self.status(self.scope('/main/projects/999/events/', access_token(self.user)))]
+        self.assertEqual(asyncio.run(scenario()), [None, 401, 401, 404])
+        self.assertEqual(self.passed, ['/main/projects/'])
+
+    def write(self):
+        task = Task.objects.create(name='Live', priority=5, order=1, creator=self.user, block=self.block)
+        TaskComment.objects.create(body='Comment', creator=self.user, task=task)
+        TaskComment.objects.get(task=task).delete()
+
+    def test_streams_committed_events(self):
+        async def scenario():
+            sent, incoming = asyncio.Queue(), asyncio.Queue()
+            stream = asyncio.ensure_future(self.application(
+                self.scope(self.url, access_token(self.user)), incoming.get, sent.put))
+            self.assertEqual((await sent.get())['status'], 200)
+            await sent.get()
+            self.assertEqual(pubsub.stats.snapshot()['connections'], 1)
+            await sync_to_async(self.write)()
+            bodies = [(await asyncio.wait_for(sent.get(), 5))['body'] for _ in range(3)]
+            await incoming.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(stream, 5)
+            return bodies
+
+        bodies = asyncio.run(scenario())
+        self.assertEqual([body.split(b'\n')[0] for body in bodies],
+                         [b'event: task.created', b'event: comment.created', b'event: comment.deleted'])
+        task = json.loads(bodies[0].split(b'data: ')[1])
+        self.assertEqual((task['data']['name'], task['version']), ('Live', 1))
+        stats = pubsub.stats.snapshot()
+        self.assertEqual((stats['connections'], stats['delivered'], stats['dropped']), (0, 3, 0))
+        self.assertIn('p99', stats['fanout_latency'])
+
+    def test_nothing_published_without_subscribers(self):
+        self.write()
+        self.assertEqual(pubsub.stats.snapshot()['published'], 0)
 
-# Create your tests here.
@@ -0,0 +1,174 @@
+import datetime as dt
+import hashlib
+import io
+import logging
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from constants import UPLOAD_PENDING, UPLOAD_PROCESSING, UPLOAD_DONE, UPLOAD_FAILED
+from main.models import DocumentUpload, TaskDocument
+from utils.background import background
+from utils.validators import validate_size
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_EXTS = ('.jpg', '.png')
+THUMBNAIL_SIZE = (256, 256)
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class PartFile(File):
+    """Lets FileSystemStorage move the assembled part file into place instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def parse_content_range(header):
+    """Parses ``bytes <start>-<end>/<total>`` into (offset, length)."""
+    match = CONTENT_RANGE_RE.match(header.strip())
+    if not match:
+        raise ValidationError('Content-Range must look like "bytes <start>-<end>/<total>"')
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start:
+        raise ValidationError('Content-Range end is before its start')
+    return start, end - start + 1
+
+
+def append_chunk(upload, stream, offset, length):
+    """Streams one chunk from ``stream`` onto the upload's part file, validating the size as it grows.
+
+    The offset is claimed before the part file is touched: the claiming update holds its row lock until
+    the transaction ends, so a competing request for the same offset finds nothing to update and never
+    writes, and a chunk that ends early rolls the claim back.
+    """
+    if upload.status != UPLOAD_PENDING:
+        raise ValidationError('Upload is no longer accepting chunks')
+    if offset != upload.received:
+        raise ValidationError(f'Expected offset {upload.received}')
+    validate_size(offset + length)
+    if offset + length > upload.size:
+        raise ValidationError(f'Chunk exceeds the declared size of {upload.size} bytes')
+
+    os.makedirs(settings.UPLOAD_CHUNK_ROOT, exist_ok=True)
+    with transaction.atomic():
+        claimed = DocumentUpload.objects.filter(id=upload.id, status=UPLOAD_PENDING, received=offset) \
+            .update(received=F('received') + length)
+        if not claimed:
+            # Another request got the chunk at this offset in first.
+            upload.received = DocumentUpload.objects.filter(id=upload.id).values_list('received', flat=True).get()
+            raise ValidationError(f'Expected offset {upload.received}')
+        written = 0
+        with open(upload.part_path, 'r+b' if offset else 'wb') as part:
+            part.seek(offset)
+            part.truncate()
+            while written < length:
+                data = stream.read(min(settings.UPLOAD_CHUNK_SIZE, length - written))
+                if not data:
+                    break
+                part.write(data)
+                written += len(data)
+        if written != length:
+            raise ValidationError(f'Chunk ended after {written} of {length} bytes')
+    upload.received = offset + written
+    return upload
+
+
+def purge_expired(hours):
+    """Fails pending uploads idle for ``hours`` and removes their part files; returns both counts.
+
+    A part file's modification time is the upload's last activity. Part files of uploads that are
+    still being finalized are kept, and pending uploads that never got a chunk expire by creation time.
+    """
+    cutoff = time.time() - hours * 3600
+    parts = {}
+    if os.path.isdir(settings.UPLOAD_CHUNK_ROOT):
+        for entry in os.scandir(settings.UPLOAD_CHUNK_ROOT):
+            name, ext = os.path.splitext(entry.name)
+            if ext != '.part' or entry.stat().st_mtime > cutoff:
+                continue
+            try:
+                parts[uuid.UUID(name)] = entry.path
+            except ValueError:
+                continue
+    statuses = dict(DocumentUpload.objects.filter(id__in=parts).values_list('id', 'status'))
+    idle = [upload_id for upload_id, status in statuses.items() if status == UPLOAD_PENDING]
+    expired = DocumentUpload.objects.filter(
+        Q(id__in=idle) | Q(created_at__lt=timezone.now() - dt.timedelta(hours=hours), received=0),
+        status=UPLOAD_PENDING).update(status=UPLOAD_FAILED, error='Expired')
+
+    removed = 0
+    for upload_id, path in parts.items():
+        if statuses.get(upload_id) == UPLOAD_PROCESSING:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return expired, removed
+
+
+def complete(upload):
+    if upload.received != upload.size:
+        raise ValidationError(f'Received {upload.received} of {upload.size} bytes')
+    updated = DocumentUpload.objects.filter(id=upload.id, status=UPLOAD_PENDING).update(status=UPLOAD_PROCESSING)
+    if not updated:
+        raise ValidationError('Upload was already completed')
+    upload.status = UPLOAD_PROCESSING
+    background.submit(finalize_upload, upload.id)
+    return upload
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(settings.UPLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _thumbnail(path):
+    from PIL import Image
+    with Image.open(path) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, format='PNG')
+    return ContentFile(output.getvalue())
+
+
+def finalize_upload(upload_id):
+    """Turns a fully received upload into a TaskDocument: checksum, thumbnail, then the file move."""
+    upload = DocumentUpload.objects.get(id=upload_id)
+    try:
+        checksum = _checksum(upload.part_path)
+        thumbnail = None
+        if os.path.splitext(upload.filename)[1].lower() in THUMBNAIL_EXTS:
+            thumbnail = _thumbnail(upload.part_path)
+        with transaction.atomic():
+            document = TaskDocument(creator_id=upload.creator_id, task_id=upload.task_id, filename=upload.filename,
+                                    checksum=checksum)
+            with open(upload.part_path, 'rb') as part:
+                document.document.save(upload.filename, PartFile(part, name=upload.filename), save=False)
+            if thumbnail is not None:
+                name, _ = os.path.splitext(upload.filename)
+                document.thumbnail.save(f'{name}.thumb.png', thumbnail, save=False)
+            document.save()
+            DocumentUpload.objects.filter(id=upload.id).update(status=UPLOAD_DONE, document=document)
+    except Exception as error:
+        logger.exception('Upload %s failed', upload.id)
+        DocumentUpload.objects.filter(id=upload.id).update(status=UPLOAD_FAILED, error=str(error)[:250])
+        raise
+    finally:
+        if os.path.exists(upload.part_path):
+            os.remove(upload.part_path)
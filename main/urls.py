@@ -1,11 +1,14 @@
 from django.urls import path
 from main.views.viewsets import ProjectListCreate, ProjectRetrieveUpdateDelete, BlockViewSet, ProjectViewSet, TaskViewSet, \
-    TaskCommentViewSet, TaskDocumentViewSet
+    TaskCommentViewSet, TaskDocumentViewSet, DocumentUploadViewSet
+from main.views.fbv import metrics, search
 from rest_framework import routers
 
 urlpatterns = [
     path('projects/', ProjectListCreate.as_view()),
-    path('projects_ud/<int:pk>/', ProjectRetrieveUpdateDelete.as_view())
+    path('projects_ud/<int:pk>/', ProjectRetrieveUpdateDelete.as_view()),
+    path('metrics/', metrics),
+    path('search/', search)
 ]
 
 router = routers.DefaultRouter()
@@ -13,6 +16,7 @@ router.register('blocks', BlockViewSet, basename='main')
 router.register('projects', ProjectViewSet, basename='main')
 router.register('tasks', TaskViewSet, basename='main')
 router.register('task_comments', TaskCommentViewSet, basename='main')
-router.register('task_documents', TaskDocumentViewSet, basename='main')
+router.register('task_documents', TaskDocumentViewSet, basename='taskdocument')
+router.register('document_uploads', DocumentUploadViewSet, basename='main')
 
 urlpatterns += router.urls
\ No newline at end of file
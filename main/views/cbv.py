@@ -21,7 +21,7 @@ from main.permissions import BlockPermission, TaskInsidePermission, TaskPermissi
 @authentication_classes((JSONWebTokenAuthentication,))
 class ProjectList(APIView):
     def get(self, request):
-        projects = Project.objects.all()
+        projects = ProjectListSerializer.setup_eager_loading(Project.objects.all())
         serializer = ProjectListSerializer(projects, many=True)
 
         return Response(serializer.data)
@@ -32,7 +32,7 @@ class ProjectList(APIView):
 class BlockList(APIView):
     def get(self, request, pk):
         project = get_object_or_404(Project, id=pk)
-        blocks = Block.objects.filter(project_id=project.id)
+        blocks = BlockListSerializer.setup_eager_loading(Block.objects.filter(project_id=project.id))
         serializer = BlockListSerializer(blocks, many=True)
 
         return Response(serializer.data)
@@ -43,7 +43,7 @@ class BlockList(APIView):
 class TaskList(APIView):
     def get(self, request, pk):
         block = get_object_or_404(Block, id=pk)
-        tasks = Task.objects.filter(block=block)
+        tasks = TaskListSerializer.setup_eager_loading(Task.objects.filter(block=block))
         serializer = TaskListSerializer(tasks, many=True)
         return Response(serializer.data)
 
@@ -53,6 +53,6 @@ class TaskList(APIView):
 class TaskCommentList(APIView):
     def get(self, request, pk):
         task = get_object_or_404(Task, id=pk)
-        comments = TaskComment.objects.filter(task=task)
+        comments = TaskCommentListSerializer.setup_eager_loading(TaskComment.objects.filter(task=task))
         serializer = TaskCommentListSerializer(comments, many=True)
         return Response(serializer.data)
\ No newline at end of file
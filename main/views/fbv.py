@@ -3,7 +3,7 @@ import logging
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import FormParser, MultiPartParser, JSONParser
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
@@ -12,8 +12,12 @@ from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 
 from main.models import Project, Block
-from main.serializers import ProjectListSerializer, BlockListSerializer
+from main.serializers import ProjectListSerializer, BlockListSerializer, SearchSerializer
 from main.permissions import BlockPermission
+from main import cache, search as search_index
+from rest_framework.utils.urls import replace_query_param
+from utils import pubsub
+from utils.metrics import store
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +25,7 @@ logger = logging.getLogger(__name__)
 @permission_classes((IsAuthenticated,))
 @authentication_classes((JSONWebTokenAuthentication, ))
 def projects(request):
-    projects = Project.objects.all()
+    projects = ProjectListSerializer.setup_eager_loading(Project.objects.all())
     serializer = ProjectListSerializer(projects, many=True)
     return Response(serializer.data)
 
@@ -30,6 +34,27 @@ def projects(request):
 @authentication_classes((JSONWebTokenAuthentication, ))
 def blocks(request, pk):
     project = get_object_or_404(Project, id=pk)
-    blocks = Block.objects.filter(project_id=project.id)
+    blocks = BlockListSerializer.setup_eager_loading(Block.objects.filter(project_id=project.id))
     serializer = BlockListSerializer(blocks, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    return Response({'requests': store.snapshot(), 'response_cache': cache.cache_stats(),
+                     'events': pubsub.stats.snapshot()})
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated,))
+def search(request):
+    serializer = SearchSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    # One extra row tells whether there is a next page without counting every match.
+    hits = search_index.search(request.user, params['q'], project=params.get('project'), kind=params.get('type'),
+                               limit=params['limit'] + 1, offset=params['offset'])
+    next_url = None
+    if len(hits) > params['limit']:
+        hits = hits[:params['limit']]
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', params['offset'] + params['limit'])
+    return Response({'next': next_url, 'results': hits})
@@ -0,0 +1,143 @@
+import hashlib
+
+from django.db.models import Count, Max, QuerySet, Sum
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from utils.metrics import serializing
+from utils.renderers import NDJSONRenderer, ndjson_line, json_array_chunks
+
+
+class OptimizedQuerysetMixin:
+    """Applies the eager loading declared by the action's serializer to the view queryset."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class PaginatedActionMixin:
+    """Paginates querysets returned by custom actions and plain API views."""
+
+    def paginated_response(self, queryset, serializer_class, pagination_class, **kwargs):
+        paginator = pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, **kwargs)
+        with serializing(self.request):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
+
+class StreamingActionMixin:
+    """Streams large exports row by row instead of building serializer.data in memory.
+
+    Selected with ``Accept: application/x-ndjson`` / ``?format=ndjson`` for NDJSON lines or
+    ``?stream=json`` for a plain JSON array.
+    """
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (NDJSONRenderer,)
+    stream_chunk_size = 500
+
+    def get_stream_format(self):
+        if self.request.accepted_renderer.format == NDJSONRenderer.format:
+            return NDJSONRenderer.format
+        stream = self.request.query_params.get('stream')
+        if stream:
+            return NDJSONRenderer.format if stream == NDJSONRenderer.format else 'json'
+        return None
+
+    def streaming_response(self, queryset, serializer_class, stream_format, **kwargs):
+        serializer = serializer_class(**kwargs)
+
+        def items():
+            for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+                with serializing(self.request):
+                    item = serializer.to_representation(obj)
+                yield item
+        if stream_format == NDJSONRenderer.format:
+            return StreamingHttpResponse((ndjson_line(item) for item in items()),
+                                         content_type=NDJSONRenderer.media_type)
+        return StreamingHttpResponse(json_array_chunks(items()), content_type='application/json')
+
+
+class ConditionalGetMixin:
+    """Answers GETs with 304 Not Modified from validators computed before anything is serialized.
+
+    Validators come from ``updated_at``/``version`` of loaded instances and one
+    ``MAX(updated_at)``/``COUNT``/``SUM(version)`` aggregate per queryset, so a client that already
+    has the current representation costs the object lookup plus those aggregates. The count catches
+    deletes, which leave no newer timestamp behind. ``conditional_related`` names attributes of the
+    retrieved object whose rows are nested in its representation.
+
+    Last-Modified is only sent for instances: a delete does not move ``MAX(updated_at)``, and its
+    whole-second resolution would hide writes made in the same second as the previous response.
+    """
+    conditional_related = ()
+
+    def get_validators(self, *sources):
+        """(ETag, Last-Modified timestamp) for model instances and querysets; querysets get no timestamp."""
+        parts, last_modified = [self.request.accepted_renderer.format], None
+        for source in sources:
+            if isinstance(source, QuerySet):
+                stats = source.order_by().aggregate(updated_at=Max('updated_at'), count=Count('pk'),
+                                                    version=Sum('version'))
+                updated_at = stats['updated_at']
+                parts.append(f"{stats['count']}.{stats['version'] or 0}")
+            else:
+                updated_at = source.updated_at
+                parts.append(f'{source.pk}.{source.version}')
+                last_modified = max(last_modified or 0, int(updated_at.timestamp()))
+            if updated_at is not None:
+                parts.append(str(updated_at.timestamp()))
+        if any(isinstance(source, QuerySet) for source in sources):
+            last_modified = None
+        return quote_etag(hashlib.md5(':'.join(parts).encode()).hexdigest()), last_modified
+
+    def conditional_response(self, validators, build_response):
+        """Returns 304 when the request's validators still match, otherwise ``build_response()``."""
+        etag, last_modified = validators
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_related_instances(self, instance):
+        related = []
+        for path in self.conditional_related:
+            obj = instance
+            for name in path.split('__'):
+                obj = getattr(obj, name)
+            related.append(obj)
+        return related
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(self.get_validators(instance, *self.get_related_instances(instance)),
+                                         lambda: self.serialized_response(instance))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(self.get_validators(queryset), lambda: self.list_response(queryset))
+
+    def list_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return self.serialized_response(queryset, many=True)
+        serializer = self.get_serializer(page, many=True)
+        with serializing(self.request):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    def serialized_response(self, instance, **kwargs):
+        serializer = self.get_serializer(instance, **kwargs)
+        with serializing(self.request):
+            return Response(serializer.data)
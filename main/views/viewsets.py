@@ -3,43 +3,65 @@ from rest_framework.views import APIView
 from rest_framework.generics import GenericAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework import mixins
 from rest_framework.permissions import IsAuthenticated
-from main.serializers import ProjectCreateSerializer, TaskSerializer, BlockDetailSerializer, TaskCommentSerializer, \
+from main.serializers import ChangeFeedSerializer, DocumentUploadSerializer, ProjectFilterSerializer, TaskBulkUpdateSerializer, TaskMoveSerializer, ProjectCreateSerializer, TaskSerializer, BlockDetailSerializer, TaskCommentSerializer, \
     TaskDocumentSerializer, ProjectDetailedSerializer, ProjectListSerializer, BlockListSerializer, \
     BlockCreateSerializer, TaskListSerializer, TaskCreateSerializer, TaskCommentListSerializer, \
     TaskDocumentListSerializer
-from main.models import Project, Block, Task, TaskComment, TaskDocument
+from main.models import Project, Block, Task, TaskComment, TaskDocument, DocumentUpload, ChangeLogEntry, bulk_touch
 from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from authe.models import MainUser
+from main.signals import tasks_bulk_updated
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from main.permissions import IsOwner, BlockPermission, TaskPermission, TaskInsidePermission
+from main.permissions import IsOwner, BlockPermission, TaskPermission, TaskInsidePermission, owner_ids
+from main import uploads, downloads, board, changelog
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
+from utils.renderers import PassthroughRenderer
+from main import cache
+from main.views.mixins import OptimizedQuerysetMixin, PaginatedActionMixin, StreamingActionMixin, ConditionalGetMixin
+from main.pagination import ProjectCursorPagination, BlockCursorPagination, TaskCursorPagination, \
+    TaskCommentCursorPagination, TaskDocumentCursorPagination
 
 import logging
+from collections import Counter
 
 
 logger = logging.getLogger(__name__)
 
 
-class ProjectListCreate(APIView):
+class ProjectListCreate(ConditionalGetMixin, PaginatedActionMixin, APIView):
     permission_classes = (IsAuthenticated, )
     http_method_names = ['get', 'post']
 
     def get(self, request):
-        projects = Project.objects.all()
-        serializer = ProjectListSerializer(projects, many=True)
-        return Response(serializer.data)
+        filters = ProjectFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        projects = ProjectListSerializer.setup_eager_loading(filters.filter_queryset(Project.objects.all()))
+        return self.conditional_response(self.get_validators(projects), lambda: self.paginated_response(
+            projects, ProjectListSerializer, ProjectCursorPagination))
 
     def post(self, request):
         serializer = ProjectCreateSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(creator=request.user)
-            logger.info(f"{request.user} created project: {serializer.data.get('name')}")
+            with transaction.atomic():
+                serializer.save(creator=request.user)
+            logger.info("%s created project: %s", request.user, serializer.data.get('name'))
             return Response(serializer.data)
-        logger.error(f"{request.user} project creation failed: {serializer.errors}")
+        logger.error("%s project creation failed: %s", request.user, serializer.errors)
         return Response(serializer.errors)
 
 
-class ProjectViewSet(mixins.RetrieveModelMixin,
+class ProjectViewSet(ConditionalGetMixin,
+                     OptimizedQuerysetMixin,
+                     PaginatedActionMixin,
+                     StreamingActionMixin,
+                     mixins.RetrieveModelMixin,
                      viewsets.GenericViewSet):
     http_method_names = ['get', 'post']
     queryset = Project.objects.all()
@@ -53,25 +75,52 @@ class ProjectViewSet(mixins.RetrieveModelMixin,
     @action(methods=['GET'], detail=True)
     def tasks(self, request, pk):
         instance = self.get_object()
-        tasks = Task.objects.filter(block__project=instance)
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = TaskSerializer.setup_eager_loading(Task.objects.filter(block__project=instance))
+        # Tasks embed their block, so renamed blocks have to change the validators too.
+        validators = self.get_validators(instance, Block.objects.filter(project=instance), tasks)
+        stream_format = self.get_stream_format()
+        if stream_format:
+            return self.conditional_response(validators, lambda: self.streaming_response(
+                tasks.order_by(*TaskCursorPagination.ordering), TaskSerializer, stream_format))
+        return self.conditional_response(validators, lambda: self.paginated_response(
+            tasks, TaskSerializer, TaskCursorPagination))
+
+    @action(methods=['GET'], detail=True)
+    def board(self, request, pk):
+        instance = self.get_object()
+        validators = self.get_validators(instance, Block.objects.filter(project=instance),
+                                         Task.objects.filter(block__project=instance))
+        return self.conditional_response(validators, lambda: Response(board.snapshot(instance)))
+
+    @action(methods=['GET'], detail=True)
+    def changes(self, request, pk):
+        instance = self.get_object()
+        serializer = ChangeFeedSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since = serializer.validated_data['since']
+        horizon = ChangeLogEntry.objects.horizon()
+        if 0 < since < horizon:
+            return Response({'detail': 'The cursor is older than the change log, sync the whole project again.',
+                             'horizon': horizon}, status=status.HTTP_410_GONE)
+        return Response(changelog.feed(instance.id, since, serializer.validated_data['limit']))
 
     @action(methods=['GET', 'POST'], detail=True)
     def blocks(self, request, pk):
         if request.method == 'GET':
             instance = self.get_object()
-            blocks = Block.objects.filter(project=instance)
-            serializer = BlockListSerializer(blocks, many=True)
-            return Response(serializer.data)
+            blocks = BlockListSerializer.setup_eager_loading(Block.objects.filter(project=instance))
+            validators = self.get_validators(instance, blocks)
+            return self.conditional_response(validators, lambda: Response(
+                cache.cached_data('project', instance.id, request, lambda: self.paginated_response(
+                    blocks, BlockListSerializer, BlockCursorPagination).data, etag=validators[0])))
         if request.method == 'POST':
             instance = self.get_object()
             serializer = BlockCreateSerializer(data=request.data)
             if serializer.is_valid():
                 serializer.save(project=instance)
-                logger.info(f"{request.user} created block: {serializer.data.get('name')}")
+                logger.info("%s created block: %s", request.user, serializer.data.get('name'))
                 return Response(serializer.data)
-            logger.error(f"{request.user} block creation failed: {serializer.errors}")
+            logger.error("%s block creation failed: %s", request.user, serializer.errors)
             return Response(serializer.errors)
 
 
@@ -88,15 +137,18 @@ class ProjectRetrieveUpdateDelete(RetrieveUpdateDestroyAPIView):
         return super(ProjectRetrieveUpdateDelete, self).get_permissions()
 
     def perform_update(self, serializer):
-        logger.info(f"{self.request.user} updated project {serializer.data.get('id')}")
+        logger.info("%s updated project %s", self.request.user, serializer.data.get('id'))
         serializer.save()
 
     def perform_destroy(self, instance):
-        logger.info(f"{self.request.user} deleted project {instance.id}")
+        logger.info("%s deleted project %s", self.request.user, instance.id)
         instance.delete()
 
 
-class BlockViewSet(mixins.ListModelMixin,
+class BlockViewSet(ConditionalGetMixin,
+                    OptimizedQuerysetMixin,
+                    PaginatedActionMixin,
+                    mixins.ListModelMixin,
                     mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
@@ -104,6 +156,8 @@ class BlockViewSet(mixins.ListModelMixin,
     http_method_names = ['get', 'post', 'put', 'patch', 'delete']
     queryset = Block.objects.all()
     permission_classes = (BlockPermission, )
+    pagination_class = BlockCursorPagination
+    conditional_related = ('project',)
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -116,30 +170,38 @@ class BlockViewSet(mixins.ListModelMixin,
     def tasks(self, request, pk):
         if request.method == 'GET':
             instance = self.get_object()
-            tasks = Task.objects.filter(block=instance)
-            serializer = TaskListSerializer(tasks, many=True)
-            return Response(serializer.data)
+            tasks = TaskListSerializer.setup_eager_loading(Task.objects.filter(block=instance))
+            validators = self.get_validators(instance, tasks)
+            return self.conditional_response(validators, lambda: Response(
+                cache.cached_data('block', instance.id, request, lambda: self.paginated_response(
+                    tasks, TaskListSerializer, TaskCursorPagination).data, etag=validators[0])))
         if request.method == 'POST':
             instance = self.get_object()
             serializer = TaskCreateSerializer(data=request.data)
             if serializer.is_valid():
-                serializer.save(block=instance, creator=request.user)
-                logger.info(f"{request.user} updated task {serializer.data.get('id')}")
+                order = serializer.validated_data.get('order')
+                if order is None:
+                    order = Task.objects.next_order(instance)
+                serializer.save(block=instance, creator=request.user, order=order)
+                logger.info("%s updated task %s", request.user, serializer.data.get('id'))
                 return Response(serializer.data)
-            logger.error(f"{request.user} task creation failed {serializer.errors}")
+            logger.error("%s task creation failed %s", request.user, serializer.errors)
             return Response(serializer.errors)
 
     def perform_update(self, serializer):
-        print(logger.name)
-        logger.info(f"{self.request.user} updated project {serializer.validated_data.get('id')}")
+        logger.info("%s updated project %s", self.request.user, serializer.validated_data.get('id'))
         serializer.save()
 
     def perform_destroy(self, instance):
-        logger.info(f"{self.request.user} deleted project {instance.id}")
+        logger.info("%s deleted project %s", self.request.user, instance.id)
         instance.delete()
 
 
-class TaskViewSet(mixins.ListModelMixin,
+class TaskViewSet(ConditionalGetMixin,
+                    OptimizedQuerysetMixin,
+                    PaginatedActionMixin,
+                    StreamingActionMixin,
+                    mixins.ListModelMixin,
                     mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
@@ -148,49 +210,140 @@ class TaskViewSet(mixins.ListModelMixin,
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = (TaskPermission, )
+    pagination_class = TaskCursorPagination
+    conditional_related = ('block', 'block__project')
+    bulk_max_size = 500
 
     @action(methods=['GET'], detail=False)
     def my(self, request):
-        tasks = Task.objects.filter(creator=self.request.user)
-        serializer = self.get_serializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = self.get_serializer_class().setup_eager_loading(Task.objects.filter(creator=self.request.user))
+
+        def build_response():
+            page = self.paginate_queryset(tasks)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return self.conditional_response(self.get_validators(tasks), build_response)
+
+    @action(methods=['PATCH'], detail=False)
+    def bulk(self, request):
+        serializer = TaskBulkUpdateSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            logger.error("%s bulk task update failed %s", request.user, serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        repeated = sorted(task_id for task_id, count in Counter(change['id'] for change in serializer.validated_data)
+                          .items() if count > 1)
+        if repeated:
+            raise ValidationError(f'Tasks listed more than once: {repeated}')
+        changes = {change['id']: change for change in serializer.validated_data}
+        if len(changes) > self.bulk_max_size:
+            raise ValidationError(f'At most {self.bulk_max_size} tasks per request')
+
+        tasks = list(Task.objects.select_related('block__project').filter(id__in=changes.keys())
+                     .only('id', 'order', 'priority', 'executor', 'creator', 'block__project__creator'))
+        if len(tasks) != len(changes):
+            raise ValidationError(f'Unknown tasks: {sorted(changes.keys() - {task.id for task in tasks})}')
+        for task in tasks:
+            if request.user.id not in (task.creator_id, task.block.project.creator_id):
+                raise PermissionDenied(TaskPermission.message)
+
+        block_ids = {change['block'] for change in changes.values() if 'block' in change}
+        block_projects = dict(Block.objects.filter(id__in=block_ids).values_list('id', 'project_id'))
+        executor_ids = {change['executor'] for change in changes.values() if change.get('executor') is not None}
+        if executor_ids and MainUser.objects.filter(id__in=executor_ids).count() != len(executor_ids):
+            raise ValidationError('Unknown executor')
+
+        fields = set()
+        affected_block_ids = set()
+        for task in tasks:
+            change = changes[task.id]
+            affected_block_ids.add(task.block_id)
+            if 'block' in change:
+                if block_projects.get(change['block']) != task.block.project_id:
+                    raise ValidationError(f'Task {task.id} can only be moved within its project')
+                task.block_id = change['block']
+                affected_block_ids.add(task.block_id)
+            if 'executor' in change:
+                task.executor_id = change['executor']
+            for field in ('order', 'priority'):
+                if field in change:
+                    setattr(task, field, change[field])
+            fields.update(field for field in ('block', 'order', 'priority', 'executor') if field in change)
+
+        if fields:
+            with transaction.atomic():
+                bulk_touch(tasks, fields, batch_size=self.bulk_max_size)
+                tasks_bulk_updated.send(sender=Task, tasks=tasks, block_ids=affected_block_ids, fields=fields)
+        logger.info("%s bulk updated %s tasks", request.user, len(tasks))
+
+        orderings = {block_id: [] for block_id in affected_block_ids}
+        for task_id, block_id in Task.objects.filter(block_id__in=affected_block_ids) \
+                .order_by(*TaskCursorPagination.ordering).values_list('id', 'block_id'):
+            orderings[block_id].append(task_id)
+        return Response({'blocks': orderings})
+
+    @action(methods=['POST'], detail=True)
+    def move(self, request, pk):
+        instance = self.get_object()
+        serializer = TaskMoveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        block = Block.objects.filter(id=serializer.validated_data['block'],
+                                     project_id=instance.block.project_id).first()
+        if block is None:
+            raise ValidationError('Task can only be moved within its project')
+        after = None
+        if serializer.validated_data.get('after') is not None:
+            after = Task.objects.filter(id=serializer.validated_data['after'], block=block).only('id', 'order').first()
+            if after is None:
+                raise ValidationError('The task to place after must be in the target block')
+        Task.objects.place(instance, block, after)
+        logger.info("%s moved task %s to block %s", request.user, instance.id, block.id)
+        return Response({'id': instance.id, 'block': block.id, 'order': instance.order})
 
     @action(methods=['GET', 'POST'], detail=True)
     def comments(self, request, pk):
         if request.method == 'GET':
             instance = self.get_object()
-            comments = TaskComment.objects.filter(task=instance)
-            serializer = TaskCommentListSerializer(comments, many=True)
-            return Response(serializer.data)
+            comments = TaskCommentListSerializer.setup_eager_loading(TaskComment.objects.filter(task=instance))
+            validators = self.get_validators(instance, comments)
+            stream_format = self.get_stream_format()
+            if stream_format:
+                return self.conditional_response(validators, lambda: self.streaming_response(
+                    comments.order_by(*TaskCommentCursorPagination.ordering), TaskCommentListSerializer,
+                    stream_format))
+            return self.conditional_response(validators, lambda: self.paginated_response(
+                comments, TaskCommentListSerializer, TaskCommentCursorPagination))
         if request.method == 'POST':
             instance = self.get_object()
             serializer = TaskCommentSerializer(data=request.data)
             if serializer.is_valid():
                 serializer.save(creator=request.user, task=instance)
-                logger.info(f"{request.user} created comment {serializer.validated_data.get('id')}")
+                logger.info("%s created comment %s", request.user, serializer.validated_data.get('id'))
                 return Response(serializer.data)
-            logger.error(f"{request.user} comment creation failed {serializer.errors}")
+            logger.error("%s comment creation failed %s", request.user, serializer.errors)
             return Response(serializer.errors)
 
     @action(methods=['GET', 'POST'], detail=True)
     def documents(self, request, pk):
         if request.method == 'GET':
             instance = self.get_object()
-            docs = TaskDocument.objects.filter(task=instance)
-            serializer = TaskDocumentListSerializer(docs, many=True, context={'base_url': request.build_absolute_uri('/')})
-            return Response(serializer.data)
+            docs = TaskDocumentListSerializer.setup_eager_loading(TaskDocument.objects.filter(task=instance))
+            return self.conditional_response(self.get_validators(instance, docs), lambda: self.paginated_response(
+                docs, TaskDocumentListSerializer, TaskDocumentCursorPagination,
+                context={'request': request}))
         if request.method == 'POST':
             instance = self.get_object()
             serializer = TaskDocumentSerializer(data=request.data)
             if serializer.is_valid():
                 serializer.save(creator=request.user, task=instance)
-                logger.info(f"{self.request.user} created document {serializer.validated_data.get('id')}")
+                logger.info("%s created document %s", self.request.user, serializer.validated_data.get('id'))
                 return Response(serializer.data)
-            logger.error(f"{self.request.user} document creation failed {serializer.errors}")
+            logger.error("%s document creation failed %s", self.request.user, serializer.errors)
             return Response(serializer.errors)
 
 
-class TaskCommentViewSet(mixins.RetrieveModelMixin,
+class TaskCommentViewSet(OptimizedQuerysetMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.DestroyModelMixin,
                     viewsets.GenericViewSet):
     http_method_names = ['get', 'post', 'delete']
@@ -200,10 +353,11 @@ class TaskCommentViewSet(mixins.RetrieveModelMixin,
 
     def perform_destroy(self, instance):
         instance.delete()
-        logger.info(f"{self.request.user} deleted comment {instance.id}")
+        logger.info("%s deleted comment %s", self.request.user, instance.id)
 
 
-class TaskDocumentViewSet(mixins.RetrieveModelMixin,
+class TaskDocumentViewSet(OptimizedQuerysetMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.DestroyModelMixin,
                     viewsets.GenericViewSet):
     http_method_names = ['get', 'post', 'delete']
@@ -211,7 +365,71 @@ class TaskDocumentViewSet(mixins.RetrieveModelMixin,
     serializer_class = TaskDocumentSerializer
     permission_classes = (TaskInsidePermission, )
     parser_classes = (MultiPartParser, FormParser, JSONParser,)
+    # Everything TaskInsidePermission and the download response read, fetched in the object query.
+    download_fields = ('id', 'document', 'filename', 'checksum', 'creator', 'task__creator',
+                       'task__block__project__creator')
+
+    def get_queryset(self):
+        if self.action == 'download':
+            return TaskDocument.objects.select_related('task__block__project').only(*self.download_fields)
+        return super().get_queryset()
 
     def perform_destroy(self, instance):
         instance.delete()
-        logger.info(f"{self.request.user} deleted document {instance.id}")
+        logger.info("%s deleted document %s", self.request.user, instance.id)
+
+    @action(methods=['GET'], detail=True, renderer_classes=(JSONRenderer, PassthroughRenderer))
+    def download(self, request, pk):
+        instance = self.get_object()
+        return downloads.document_response(request, instance)
+
+
+class DocumentUploadViewSet(mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
+                    viewsets.GenericViewSet):
+    """Resumable chunked uploads: create, PUT chunks with Content-Range, then complete.
+
+    Finalization (checksum, thumbnail, moving the file into place) runs on the background queue.
+    """
+    http_method_names = ['get', 'post', 'put']
+    serializer_class = DocumentUploadSerializer
+    permission_classes = (IsAuthenticated, )
+
+    def get_queryset(self):
+        return DocumentUpload.objects.filter(creator=self.request.user)
+
+    def perform_create(self, serializer):
+        task = serializer.validated_data['task']
+        if self.request.user.id not in owner_ids(self.request, task):
+            raise PermissionDenied(TaskPermission.message)
+        serializer.save(creator=self.request.user)
+        logger.info("%s started upload %s", self.request.user, serializer.instance.id)
+
+    @action(methods=['PUT'], detail=True)
+    def chunk(self, request, pk):
+        instance = self.get_object()
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        try:
+            if 'HTTP_CONTENT_RANGE' in request.META:
+                offset, range_length = uploads.parse_content_range(request.META['HTTP_CONTENT_RANGE'])
+                if range_length != length:
+                    raise DjangoValidationError('Content-Range does not match Content-Length')
+            else:
+                offset = int(request.query_params.get('offset', instance.received))
+            uploads.append_chunk(instance, request.stream, offset, length)
+        except (DjangoValidationError, ValueError) as error:
+            logger.error("%s upload %s chunk rejected: %s", request.user, instance.id, error)
+            return Response({'detail': getattr(error, 'messages', [str(error)]), 'received': instance.received},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(instance).data)
+
+    @action(methods=['POST'], detail=True)
+    def complete(self, request, pk):
+        instance = self.get_object()
+        try:
+            uploads.complete(instance)
+        except DjangoValidationError as error:
+            return Response({'detail': error.messages, 'received': instance.received},
+                            status=status.HTTP_409_CONFLICT)
+        logger.info("%s completed upload %s", request.user, instance.id)
+        return Response(self.get_serializer(instance).data, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,55 @@
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """A single daemon thread draining jobs submitted once the current transaction commits.
+
+    With ``BACKGROUND_TASKS_EAGER`` set, jobs run inline instead (tests, management commands).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        transaction.on_commit(lambda: self._enqueue(func, args, kwargs))
+
+    def _enqueue(self, func, args, kwargs):
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            func(*args, **kwargs)
+            return
+        self._ensure_worker()
+        self._queue.put((func, args, kwargs))
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            close_old_connections()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('%s: background job %s failed', self.name, func.__name__)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+
+background = BackgroundQueue('jira-background')
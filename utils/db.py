@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver: applies settings.SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
+
+
+def check_connection_health(**kwargs):
+    """request_started receiver: drops persistent connections that died while idle.
+
+    Connections used within DATABASE_HEALTH_CHECK_AFTER seconds are trusted without a round trip.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.settings_dict['CONN_MAX_AGE'] == 0:
+            continue
+        last_checked = getattr(connection, '_health_checked_at', 0)
+        if now - last_checked < settings.DATABASE_HEALTH_CHECK_AFTER:
+            continue
+        if connection.is_usable():
+            connection._health_checked_at = now
+        else:
+            logger.warning('Closing unusable connection to %s', connection.alias)
+            connection.close()
+
+
+def mark_connection_used(**kwargs):
+    """request_finished receiver: a connection that just served a request is known to be alive."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection._health_checked_at = now
+
+
+_state = threading.local()
+
+
+def replica_reads_allowed():
+    return getattr(_state, 'replica_reads', False)
+
+
+def set_replica_reads(allowed):
+    _state.replica_reads = allowed
+
+
+@contextmanager
+def primary_reads():
+    """Reads from the primary inside the block, e.g. while filling a cache other users read from."""
+    allowed = replica_reads_allowed()
+    set_replica_reads(False)
+    try:
+        yield
+    finally:
+        set_replica_reads(allowed)
+
+
+def check_replica_pin_cache(app_configs, **kwargs):
+    """System check: with replicas configured, the pins must live in a cache every process shares."""
+    if not settings.REPLICA_DATABASES:
+        return []
+    if not isinstance(caches[settings.REPLICA_PIN_CACHE], (LocMemCache, DummyCache)):
+        return []
+    return [checks.Error(
+        f'REPLICA_PIN_CACHE {settings.REPLICA_PIN_CACHE!r} is not shared between processes, so a user '
+        f'pinned by one process reads stale rows from a replica in another.',
+        hint='Point REPLICA_PIN_CACHE at a memcached or redis cache alias.',
+        id='utils.E001',
+    )]
+
+
+class ReplicaRouter:
+    """Sends reads to settings.REPLICA_DATABASES while ReplicaRoutingMiddleware allows it.
+
+    Writes, select_for_update and anything inside a transaction on the primary stay on ``default``;
+    so do management commands and background jobs, which never go through the middleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.REPLICA_DATABASES or not replica_reads_allowed():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
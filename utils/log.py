@@ -0,0 +1,67 @@
+import copy
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came in through ``extra=`` and is emitted as a field.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extras and the traceback if any."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Puts records on a bounded queue; a QueueListener thread hands them to the real handlers.
+
+    ``handlers`` are references like ``cfg://handlers.main_file``. dictConfig builds handlers in
+    name order, so queue handlers need names that sort after their targets. When the queue is full
+    records are dropped and counted instead of blocking the request thread.
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        # dictConfig resolves cfg:// references on item access, not on iteration.
+        handlers = [handlers[index] for index in range(len(handlers))]
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self._listening = True
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Merge args and render the traceback now; extras stay on the record for JSONFormatter.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        # logging.shutdown() closes handlers newest first, so the listener drains before its targets close.
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+        super().close()
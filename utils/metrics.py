@@ -0,0 +1,100 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+# Collapses literals so the same statement with different values counts as a repeat.
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def normalize_sql(sql):
+    return _LITERAL_RE.sub('?', sql)
+
+
+class RequestMetrics:
+    """What one request spent: set up by PerformanceMiddleware, fed by the DB execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.view_started = self.view_finished = None
+        self.render = 0.0
+        self.serialize = 0.0
+        self.db = 0.0
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries[normalize_sql(sql)] += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        threshold = settings.PERFORMANCE_DUPLICATE_QUERY_THRESHOLD
+        return {sql: count for sql, count in self.queries.items() if count >= threshold}
+
+    @contextmanager
+    def serializing(self):
+        """Times the block as serialization, less the queries it ran, which count as ``db``."""
+        started, db = time.perf_counter(), self.db
+        try:
+            yield
+        finally:
+            self.serialize += max(time.perf_counter() - started - (self.db - db), 0.0)
+
+    def timings(self):
+        """Seconds per phase; ``view`` is Python time in the view without the DB and serialization."""
+        finished = time.perf_counter()
+        view = 0.0
+        if self.view_started is not None:
+            view = max((self.view_finished or finished) - self.view_started - self.db - self.serialize, 0.0)
+        return {'total': finished - self.started, 'db': self.db, 'view': view, 'serialize': self.serialize,
+                'render': self.render}
+
+
+def serializing(request):
+    """Times the block as the serialize phase of ``request`` (Django or DRF) when it is being measured."""
+    metrics = getattr(getattr(request, '_request', request), '_metrics', None)
+    return metrics.serializing() if metrics is not None else nullcontext()
+
+
+class MetricsStore:
+    """Keeps the latest PERFORMANCE_SAMPLE_SIZE samples per view for percentile reports."""
+
+    fields = ('total', 'db', 'view', 'serialize', 'render', 'queries', 'size')
+
+    def __init__(self):
+        self._samples = defaultdict(lambda: deque(maxlen=settings.PERFORMANCE_SAMPLE_SIZE))
+        self._lock = threading.Lock()
+
+    def add(self, view, sample):
+        with self._lock:
+            self._samples[view].append(tuple(sample[field] for field in self.fields))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self, percentiles=(50, 90, 99)):
+        with self._lock:
+            samples = {view: list(values) for view, values in self._samples.items()}
+        report = {}
+        for view, values in samples.items():
+            report[view] = {'count': len(values)}
+            for index, field in enumerate(self.fields):
+                column = sorted(value[index] for value in values)
+                report[view][field] = {f'p{p}': column[min(len(column) - 1, len(column) * p // 100)]
+                                       for p in percentiles}
+        return report
+
+
+store = MetricsStore()
@@ -0,0 +1,165 @@
+import logging
+import time
+from contextlib import ExitStack
+
+import jwt
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from rest_framework.authentication import get_authorization_header
+from rest_framework_jwt.settings import api_settings as jwt_settings
+
+from authe.authentication import decode_token
+from utils.db import set_replica_reads
+from utils.metrics import RequestMetrics, store
+
+logger = logging.getLogger('metrics')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """Lets safe requests read from replicas, except shortly after the same user wrote.
+
+    A successful unsafe request pins its user to the primary for REPLICA_PIN_SECONDS through a key in
+    REPLICA_PIN_CACHE, a cache shared by all processes (see utils.db.check_replica_pin_cache), so every
+    process serves that user's reads from the primary while the replicas catch up. JWT users are identified from the token, which DRF only authenticates in the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user_id = self.user_id(request)
+        set_replica_reads(request.method in SAFE_METHODS and not self.pinned(user_id))
+        try:
+            response = self.get_response(request)
+        finally:
+            set_replica_reads(False)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # DRF sets request.user once the view authenticated; it covers tokens issued by the write itself.
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                user_id = user.id
+            if user_id is not None:
+                caches[settings.REPLICA_PIN_CACHE].set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def user_id(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) == 2 and auth[0].lower() == jwt_settings.JWT_AUTH_HEADER_PREFIX.lower().encode():
+            try:
+                return decode_token(auth[1].decode()).get('user_id')
+            except (jwt.InvalidTokenError, UnicodeError):
+                return None
+        user = getattr(request, 'user', None)
+        return user.id if user is not None and user.is_authenticated else None
+
+    def pinned(self, user_id):
+        return user_id is not None and caches[settings.REPLICA_PIN_CACHE].get(pin_key(user_id)) is not None
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def view_name(view_func, request):
+    """``ViewSet.action`` for DRF views, the function's qualified name otherwise."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+
+
+class MeasuredStream:
+    """Counts the bytes of a streamed body and calls ``finish(size)`` once when the response closes it."""
+
+    def __init__(self, content, finish):
+        self.content, self.finish, self.size = content, finish, 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.content)
+        self.size += len(chunk)
+        return chunk
+
+    def close(self):
+        finish, self.finish = self.finish, None
+        if finish is not None:
+            finish(self.size)
+
+
+class PerformanceMiddleware:
+    """Times every request (DB, view, serialize, render), counts queries and flags statements repeated N+1 style.
+
+    Each request is logged on the ``metrics`` logger with the figures as extra fields (one JSON line in
+    logs/metrics.log) and added to the percentile store
+    served by main.views.fbv.metrics; PERFORMANCE_SERVER_TIMING adds a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request._metrics = RequestMetrics()
+        stack = ExitStack()
+        try:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        if not response.streaming:
+            stack.close()
+            self.report(request, response, metrics, len(response.content))
+            return response
+
+        # A streamed body runs its queries while it is iterated, after this method returned.
+        def finish(size):
+            stack.close()
+            self.report(request, response, metrics, size or int(response.get('Content-Length', 0)))
+        if getattr(response, 'file_to_stream', None) is not None:
+            # Replacing the content of a FileResponse would drop the wsgi.file_wrapper (sendfile) path.
+            response._resource_closers.append(lambda: finish(0))
+        else:
+            response.streaming_content = MeasuredStream(response.streaming_content, finish)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics.view = view_name(view_func, request)
+        request._metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = request._metrics
+        metrics.view_finished = started = time.perf_counter()
+
+        def rendered(response):
+            metrics.render = time.perf_counter() - started
+        response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, metrics, size):
+        timings = metrics.timings()
+        duplicates = metrics.duplicates()
+        view = metrics.view or 'unresolved'
+        record = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': metrics.query_count,
+            'size': size,
+            **{f'{phase}_ms': round(seconds * 1000, 2) for phase, seconds in timings.items()},
+        }
+        if duplicates:
+            record['duplicate_queries'] = [{'count': count, 'sql': sql[:300]} for sql, count in duplicates.items()]
+        logger.info('%s %s %s', request.method, request.path, response.status_code, extra=record)
+        store.add(view, dict(timings, queries=metrics.query_count, size=size))
+        # The headers of a streamed response are already sent when it is reported.
+        if settings.PERFORMANCE_SERVER_TIMING and not response.streaming:
+            response['Server-Timing'] = ', '.join(f'{phase};dur={seconds * 1000:.1f}'
+                                                  for phase, seconds in timings.items())
@@ -2,4 +2,9 @@ def find_type(tuple, index):
     type_name = [item[1] for item in tuple if item[0] == index][0]
     if isinstance(type_name, (type(''))) and type_name != '':
         return type_name
-    return ''
\ No newline at end of file
+    return ''
+
+
+def type_display_name(tuple, index):
+    name = find_type(tuple, index).lower().replace('_', ' ')
+    return f'{name[0].upper()}{name[1:]}' if name else ''
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PubSubStats:
+    """Subscriber gauge, message counters and publish-to-delivery latency samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.connections = 0
+            self.published = self.delivered = self.dropped = 0
+            self._latencies = deque(maxlen=settings.PERFORMANCE_SAMPLE_SIZE)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def delivered_after(self, latency):
+        with self._lock:
+            self.delivered += 1
+            self._latencies.append(latency)
+
+    def snapshot(self, percentiles=(50, 90, 99)):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            report = {'connections': self.connections, 'published': self.published,
+                      'delivered': self.delivered, 'dropped': self.dropped}
+        report['fanout_latency'] = {f'p{p}': latencies[min(len(latencies) - 1, len(latencies) * p // 100)]
+                                    for p in percentiles} if latencies else {}
+        return report
+
+
+stats = PubSubStats()
+
+
+class Subscription:
+    """One subscriber's bounded queue on the event loop that created it.
+
+    A slow subscriber loses messages instead of holding up the publisher; ``dropped`` is counted.
+    """
+
+    def __init__(self, backend, channel, maxsize):
+        self.backend = backend
+        self.channel = channel
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        """Called from any thread; the message is queued on the subscriber's loop."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message, time.perf_counter())
+        except RuntimeError:
+            # The loop is closed; the subscriber is gone and unsubscribes on its way out.
+            stats.add(dropped=1)
+
+    def _put(self, message, published_at):
+        try:
+            self.queue.put_nowait((message, published_at))
+        except asyncio.QueueFull:
+            stats.add(dropped=1)
+
+    async def get(self):
+        message, published_at = await self.queue.get()
+        stats.delivered_after(time.perf_counter() - published_at)
+        return message
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class LocalBackend:
+    """In-process fan-out: publishers in request threads, subscribers on the ASGI event loop.
+
+    Only subscribers connected to the same process see a message; a backend wrapping a broker has to
+    provide the same subscribe/unsubscribe/publish/listening methods.
+    """
+
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        stats.add(connections=1)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._channels[subscription.channel]
+        stats.add(connections=-1)
+
+    def listening(self):
+        """Whether publishing can reach anyone, so publishers can skip building messages."""
+        return bool(self._channels)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        stats.add(published=1)
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    """The PUBSUB_BACKEND instance shared by the process."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.PUBSUB_BACKEND)()
+    return _broker
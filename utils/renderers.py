@@ -0,0 +1,44 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict) and 'results' in data:
+            data = data['results']
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(ndjson_line(item) for item in data)
+
+
+def ndjson_line(item):
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def json_array_chunks(items):
+    yield b'['
+    for index, item in enumerate(items):
+        if index:
+            yield b','
+        yield json.dumps(item, cls=JSONEncoder, ensure_ascii=False).encode('utf-8')
+    yield b']'
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Lets file download actions accept any media type; error payloads still go out as JSON."""
+    media_type = '*/*'
+    format = None
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, bytes):
+            return data or b''
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode('utf-8')
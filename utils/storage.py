@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores every distinct file once under its sha256 digest and reference counts the fields using it.
+
+    ``upload_to`` only contributes the extension; saving content that is already stored costs no write.
+    """
+    prefix = 'blobs'
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        checksum = digest.hexdigest()
+        return f'{self.prefix}/{checksum[:2]}/{checksum}{os.path.splitext(name)[1].lower()}'
+
+    def _save(self, name, content):
+        from main.models import Blob
+        name = self.blob_name(name, content)
+        if not self.exists(name):
+            name = super()._save(name, content)
+        # Saving the content a field already holds keeps its one reference.
+        if name != getattr(content, 'held_name', None):
+            Blob.objects.acquire(name, content.size)
+        return name
+
+    def delete(self, name):
+        """Drops a reference now and unlinks the file once the transaction commits, so a rollback keeps it."""
+        from main.models import Blob
+        if Blob.objects.release(name):
+            transaction.on_commit(lambda: self.unlink(name))
+
+    def unlink(self, name):
+        from main.models import Blob
+        # The content may have been stored again since the last reference went away.
+        if not Blob.objects.filter(name=name).exists():
+            super().delete(name)
+
+
+class ContentAddressedFieldFile(FieldFile):
+    def save(self, name, content, save=True):
+        content.held_name = self.name
+        super().save(name, content, save)
+
+
+class ContentAddressedFileField(models.FileField):
+    """FileField telling ContentAddressedStorage which blob it already holds."""
+    attr_class = ContentAddressedFieldFile
@@ -1,7 +1,3 @@
-import shutil
-import os
-
-
 def document_path(instance, filename):
     from main.models import TaskDocument
     if type(instance) == TaskDocument:
@@ -13,7 +9,8 @@ def avatar_path(instance, filename):
     return f'avatars/{instance.id}/{filename}'
 
 
-def task_delete_path(document):
-    path = os.path.abspath(os.path.join(document.path, '..'))
-    if os.path.isdir(path):
-        shutil.rmtree(path)
\ No newline at end of file
+def release_files(*files):
+    # Storage.delete() drops a reference; the blob is unlinked once nothing points at it.
+    for file in files:
+        if file:
+            file.storage.delete(file.name)
\ No newline at end of file
@@ -2,12 +2,19 @@ import os
 from django.core.exceptions import ValidationError
 
 ALLOWED_EXTS = ['.jpg', '.png', '.docx']
+MAX_FILE_SIZE = 5000000
 
 def validate_file_size(value):
-  if value.size > 5000000:
-    raise ValidationError('max file size: 5Mb')
+  validate_size(value.size)
 
 def validate_extension(value):
-  ext = os.path.splitext(value.name)[1]
+  validate_filename(value.name)
+
+def validate_size(size):
+  if size > MAX_FILE_SIZE:
+    raise ValidationError('max file size: 5Mb')
+
+def validate_filename(name):
+  ext = os.path.splitext(name)[1]
   if not ext.lower() in ALLOWED_EXTS:
     raise ValidationError(f'not allowed file ext, allowed: {ALLOWED_EXTS}')
\ No newline at end of file